@@ -161,7 +161,7 @@ async function updateSchedules() {
 }
 
 async function addSchedule() {
-  await API.post("schedules", {
+  const res = await API.post("schedules", {
     device: document.getElementById("s-dev").value,
     action: document.getElementById("s-action").value,
     type: document.getElementById("s-type").value,
@@ -169,7 +169,7 @@ async function addSchedule() {
     days: [0, 1, 2, 3, 4, 5, 6],
   });
   updateSchedules();
-  alert("Schedule Added");
+  alert(res.error ? "Error: " + res.error : "Schedule Added");
 }
 
 async function delSched(id) {
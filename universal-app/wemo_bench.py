@@ -0,0 +1,216 @@
+"""Developer benchmarks for wemo_server.py. Not shipped in the packages.
+
+    python wemo_bench.py fastpath [--calls N]
+    python wemo_bench.py memory [--sizes 1000,10000,50000]
+    python wemo_bench.py schedule [--sizes 100,1000,10000]
+"""
+import sys
+import time
+import argparse
+import random
+import datetime
+import tracemalloc
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import wemo_server as server
+
+# --- FAKE DEVICE ---
+SETUP_XML = """<?xml version="1.0"?>
+<root xmlns="urn:Belkin:device-1-0"><specVersion><major>1</major><minor>0</minor></specVersion>
+<device><deviceType>urn:Belkin:device:controllee:1</deviceType><friendlyName>Bench Plug</friendlyName>
+<manufacturer>Belkin International Inc.</manufacturer><modelDescription>Belkin Plugin Socket 1.0</modelDescription>
+<modelName>Socket</modelName><serialNumber>BENCH0001</serialNumber><UDN>uuid:Socket-1_0-BENCH0001</UDN>
+<macAddress>000000000001</macAddress>
+<serviceList><service><serviceType>urn:Belkin:service:basicevent:1</serviceType>
+<serviceId>urn:Belkin:serviceId:basicevent1</serviceId><controlURL>/upnp/control/basicevent1</controlURL>
+<eventSubURL>/upnp/event/basicevent1</eventSubURL><SCPDURL>/eventservice.xml</SCPDURL></service></serviceList>
+</device></root>"""
+
+SCPD_XML = """<?xml version="1.0"?>
+<scpd xmlns="urn:Belkin:service-1-0"><specVersion><major>1</major><minor>0</minor></specVersion><actionList>
+<action><name>SetBinaryState</name><argumentList><argument><name>BinaryState</name>
+<relatedStateVariable>BinaryState</relatedStateVariable><direction>in</direction></argument></argumentList></action>
+<action><name>GetBinaryState</name><argumentList><argument><name>BinaryState</name>
+<relatedStateVariable>BinaryState</relatedStateVariable><direction>out</direction></argument></argumentList></action>
+</actionList><serviceStateTable><stateVariable sendEvents="yes"><name>BinaryState</name>
+<dataType>Boolean</dataType><defaultValue>0</defaultValue></stateVariable></serviceStateTable></scpd>"""
+
+STATE_RESPONSE = (b'<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+                  b'<s:Body><u:GetBinaryStateResponse xmlns:u="urn:Belkin:service:basicevent:1"><BinaryState>1</BinaryState>'
+                  b'</u:GetBinaryStateResponse></s:Body></s:Envelope>')
+
+class FakeDeviceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args): pass
+
+    def reply(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml"); self.send_header("Content-Length", str(len(body)))
+        self.end_headers(); self.wfile.write(body)
+
+    def do_GET(self):
+        self.reply((SETUP_XML if self.path == "/setup.xml" else SCPD_XML).encode())
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        # Like the device, only origin-form control paths are understood
+        if not self.path.startswith("/upnp/control/"): self.send_error(404); return
+        self.reply(STATE_RESPONSE)
+
+def start_fake_device():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeDeviceHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd.server_address[1]
+
+class CannedResponse:
+    status = 200; data = STATE_RESPONSE; content = STATE_RESPONSE
+
+def canned_session():
+    """A pywemo Session that never touches the network, so only client-side
+    overhead is measured."""
+    from pywemo.ouimeaux_device.api.service import Session
+    class CannedSession(Session):
+        def request(self, method, url, **kwargs): return CannedResponse()
+    return CannedSession("http://127.0.0.1:49153/setup.xml")
+
+# --- HELPERS ---
+def timed(fn, calls):
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter(); fn(); samples.append(time.perf_counter() - start)
+    return samples
+
+def report(label, samples):
+    ordered = sorted(samples)
+    mean = sum(ordered) / len(ordered)
+    p50 = ordered[len(ordered) // 2]; p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"  {label:<28} mean {mean * 1e6:9.1f}us   p50 {p50 * 1e6:9.1f}us   p99 {p99 * 1e6:9.1f}us")
+    return mean
+
+# --- BENCHMARKS ---
+def bench_fastpath(args):
+    import pywemo
+    from pywemo.ouimeaux_device.api.service import Session
+    port = start_fake_device()
+    url = f"http://127.0.0.1:{port}/setup.xml"
+
+    print(f"GetBinaryState over loopback ({args.calls} calls)")
+    dev = pywemo.discovery.device_from_description(url)
+    dev.session = Session(url)
+    stock = report("pywemo, per-call pool", timed(lambda: dev.get_state(force_update=True), args.calls))
+    dev.session = server.http_sessions.get(dev.udn, url)
+    pooled = report("pywemo, pooled session", timed(lambda: dev.get_state(force_update=True), args.calls))
+    fast = server.FastBasicEvent("127.0.0.1", port)
+    quick = report("fast path, pooled session", timed(fast.get_state, args.calls))
+    print(f"  speedup vs stock pywemo: {stock / quick:.1f}x (pooled pywemo {stock / pooled:.1f}x)")
+
+    print(f"Client overhead only, canned response ({args.calls} calls)")
+    dev.session = canned_session()
+    slow = report("pywemo action + lxml", timed(lambda: dev.get_state(force_update=True), args.calls))
+    fast.session = canned_session()
+    quick = report("fast path template + regex", timed(fast.get_state, args.calls))
+    print(f"  speedup: {slow / quick:.1f}x")
+
+def fake_fields(i):
+    # Fresh strings per device, as json.load produces them from devices.json
+    return {"name": f"Plug {i}", "udn": f"uuid:Socket-1_0-221{i:09d}", "ip": f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+            "mac": f"94103E{i:06X}", "serial": f"221{i:09d}", "state": str(i % 2), "type": "".join(["swi", "tch"]),
+            "last_seen": str(1.7e9 + i), "reachability": "".join(["onl", "ine"])}
+
+def measure(build, count):
+    """Bytes retained by build(count), per device."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build(count)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return used / count
+
+def bench_memory(args):
+    def as_dicts(count):
+        # The old registry entry: a dict per device holding whatever it was given
+        entries = {}
+        for i in range(count):
+            fields = fake_fields(i)
+            entries[fields["serial"]] = {**fields, "handle": None, "state": int(fields["state"]), "last_seen": float(fields["last_seen"]),
+                                         "failures": 0, "healing": False, "key": fields["serial"]}
+        return entries
+
+    def as_records(count):
+        entries = {}
+        for i in range(count):
+            fields = fake_fields(i)
+            entries[fields["serial"]] = server.DeviceRecord(key=fields["serial"], **fields)
+        return entries
+
+    print("Registry memory per device (entry plus its strings, handles excluded)")
+    for count in args.sizes:
+        old = measure(as_dicts, count); new = measure(as_records, count)
+        print(f"  {count:>6} devices   dict {old:7.0f} B   DeviceRecord {new:7.0f} B   saved {1 - new / old:5.1%}")
+
+def fake_rules(count):
+    rng = random.Random(count)
+    jobs = []
+    for i in range(count):
+        kind = rng.choice(["Time (Fixed)", "Time (Fixed)", "Sunrise", "Sunset"])
+        value = f"{rng.randrange(24):02d}:{rng.randrange(60):02d}" if kind == "Time (Fixed)" else rng.randrange(0, 90)
+        jobs.append({"id": i, "device": f"Plug {i}", "type": kind, "action": "Turn ON", "value": value,
+                     "offset_dir": rng.choice([1, -1]), "days": sorted(rng.sample(range(7), rng.randint(1, 7))), "last_run": ""})
+    return jobs
+
+def legacy_tick(jobs, now, solar):
+    # The per-tick work of the old 30s scheduler_loop, minus the file read and the action
+    today_str = now.strftime("%Y-%m-%d"); weekday = now.weekday(); current_hhmm = now.strftime("%H:%M"); due = 0
+    for job in jobs:
+        job_days = job.get('days', [])
+        if not job_days or weekday not in job_days: continue
+        trigger_time = ""
+        if job['type'] == "Time (Fixed)": trigger_time = job['value']
+        elif solar:
+            base = solar['sunrise'] if job['type'] == "Sunrise" else solar['sunset']
+            dt = datetime.datetime.strptime(f"{today_str} {base}", "%Y-%m-%d %H:%M")
+            trigger_time = (dt + datetime.timedelta(minutes=int(job['value']) * int(job.get('offset_dir', 1)))).strftime("%H:%M")
+        if trigger_time == current_hhmm and job.get('last_run') != today_str: due += 1
+    return due
+
+def bench_schedule(args):
+    solar = {"sunrise": "06:42", "sunset": "18:17"}
+    day = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
+    print("Scheduler cost per tick, old full scan vs compiled daily index")
+    for count in args.sizes:
+        jobs = fake_rules(count)
+        legacy = sum(timed(lambda: legacy_tick(jobs, day + datetime.timedelta(hours=12), solar), 5)) / 5
+
+        sched = server.TimerScheduler(server.SCHEDULER_STATE_FILE)
+        start = time.perf_counter(); sched.rules = [r for r in map(server.compile_rule, jobs) if r]; compiled = time.perf_counter() - start
+        start = time.perf_counter(); sched.build_index(day, solar); indexed = time.perf_counter() - start
+        # One wake-up per minute of the day, each taking whatever is due
+        ticks = [day.timestamp() + minute * 60 for minute in range(1440)]
+        start = time.perf_counter()
+        fired = sum(len(sched.due(t)) for t in ticks)
+        per_tick = (time.perf_counter() - start) / len(ticks)
+        print(f"  {count:>6} rules   old tick {legacy * 1e3:8.2f}ms   compile {compiled * 1e3:7.2f}ms   "
+              f"index {indexed * 1e3:7.2f}ms   due() {per_tick * 1e6:6.1f}us/tick ({fired} fired)")
+    print("  compile runs when rules change, index at midnight or on change; due() is the per-wake cost")
+
+def main():
+    parser = argparse.ArgumentParser(description="wemo_server benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+    p = sub.add_parser("fastpath", help="BasicEvent fast path vs pywemo")
+    p.add_argument("--calls", type=int, default=500)
+    p.set_defaults(func=bench_fastpath)
+    p = sub.add_parser("memory", help="bytes per registry entry, dict vs DeviceRecord")
+    p.add_argument("--sizes", type=lambda v: [int(n) for n in v.split(",")], default=[1000, 10000, 50000])
+    p.set_defaults(func=bench_memory)
+    p = sub.add_parser("schedule", help="per-tick scheduler cost, old loop vs compiled index")
+    p.add_argument("--sizes", type=lambda v: [int(n) for n in v.split(",")], default=[100, 1000, 10000])
+    p.set_defaults(func=bench_schedule)
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -517,15 +517,16 @@ class WemoOpsApp(ctk.CTk):
         def log(m): self.after(0, lambda: self.scan_status.configure(text=m))
         try:
             log("SSDP Scan...")
+            # Keyed by UDN so renamed or same-named devices don't collide
             new_map = {}
             for d in pywemo.discover_devices(): 
-                new_map[d.name] = d
+                new_map[d.udn] = d
             
             if subnet:
                 log(f"Scanning {subnet}...")
                 deep_devs = self.scanner.scan_subnet(subnet)
                 for d in deep_devs:
-                    new_map[d.name] = d
+                    new_map[d.udn] = d
             
             self.known_devices_map = new_map
             log("Scan Complete") 
@@ -538,10 +539,10 @@ class WemoOpsApp(ctk.CTk):
         self.run_local_scan()
 
     def render_devices(self):
-        self.device_switches = {}
-        current_names = sorted(list(self.known_devices_map.keys()))
+        current_names = sorted((udn, d.name) for udn, d in self.known_devices_map.items())
         if current_names == self.last_rendered_device_names: return 
         self.last_rendered_device_names = current_names
+        self.device_switches = {}
         
         for w in self.dev_list.winfo_children(): w.destroy()
         devs = list(self.known_devices_map.values())
@@ -565,7 +566,7 @@ class WemoOpsApp(ctk.CTk):
         def tog(d=dev): threading.Thread(target=d.toggle, daemon=True).start()
         sw = ctk.CTkSwitch(t, text="Power", command=tog, text_color=COLOR_TEXT)
         sw.pack(side="right")
-        self.device_switches[dev.name] = sw
+        self.device_switches[dev.udn] = sw
         
         try:
             state = dev.get_state(force_update=False)
@@ -583,8 +584,8 @@ class WemoOpsApp(ctk.CTk):
                     try: d.set_brightness(int(val))
                     except: pass
                 threading.Thread(target=t, daemon=True).start()
-                if int(val) > 0: self.device_switches[d.name].select()
-                else: self.device_switches[d.name].deselect()
+                if int(val) > 0: self.device_switches[d.udn].select()
+                else: self.device_switches[d.udn].deselect()
 
             slider = ctk.CTkSlider(dim_frame, from_=0, to=100, command=set_brightness)
             try: slider.set(state if state else 0)
@@ -795,19 +796,19 @@ class WemoOpsApp(ctk.CTk):
         while self.monitoring:
             try:
                 if not self.frames["dash"].winfo_ismapped(): time.sleep(2); continue
-                for name, dev in self.known_devices_map.items():
-                    if name in self.device_switches:
+                for udn, dev in list(self.known_devices_map.items()):
+                    if udn in self.device_switches:
                         try:
                             state = dev.get_state(force_update=True)
-                            self.after(0, lambda n=name, s=state: self._update_switch_safe(n, s))
+                            self.after(0, lambda u=udn, s=state: self._update_switch_safe(u, s))
                         except: pass
             except: pass
             time.sleep(2) 
 
-    def _update_switch_safe(self, name, state):
-        if name in self.device_switches:
+    def _update_switch_safe(self, udn, state):
+        if udn in self.device_switches:
             try:
-                sw = self.device_switches[name]
+                sw = self.device_switches[udn]
                 if state > 0: sw.select()
                 else: sw.deselect()
             except: pass
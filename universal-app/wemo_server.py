@@ -1,23 +1,71 @@
 import os
+import atexit
+import signal
 import sys
 import json
 import time
+import heapq
+import bisect
+import itertools
+import collections
 import threading
+import re
 import datetime
 import socket
+import types
+import struct
+import subprocess
+import urllib.parse
 import logging
 import ipaddress
 import concurrent.futures
 import requests
-from flask import Flask, render_template, jsonify, request
+import urllib3
+from flask import Flask, Response, render_template, jsonify, request
 from waitress import serve
 from pywemo.ouimeaux_device.dimmer import Dimmer
+from pywemo.ouimeaux_device.api.service import Session
+from pywemo.exceptions import ActionException, HTTPException, HTTPNotOkException
 
 # --- CONFIGURATION ---
 VERSION = "v5.3.0-Server"
 PORT = int(os.environ.get("PORT", 5050)) 
 HOST = "0.0.0.0"
 SCAN_INTERVAL = int(os.environ.get("SCAN_INTERVAL", 300))
+POLL_INTERVAL = float(os.environ.get("POLL_INTERVAL", 2))
+IDLE_POLL_INTERVAL = float(os.environ.get("IDLE_POLL_INTERVAL", 60))
+CONSUMER_TTL = float(os.environ.get("CONSUMER_TTL", 30))
+SERVE_THREADS = int(os.environ.get("SERVE_THREADS", 16))
+MAX_STREAMS = int(os.environ.get("MAX_STREAMS", 4))  # each open /api/stream holds a waitress thread
+WORKER_IDLE_TIMEOUT = 60
+HEDGE_READS = os.environ.get("HEDGE_READS", "0") == "1"
+HEDGE_BUDGET = float(os.environ.get("HEDGE_BUDGET", 0.1))
+HEDGE_MIN_SAMPLES = 20
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 2))
+HTTP_IDLE_TIMEOUT = float(os.environ.get("HTTP_IDLE_TIMEOUT", 30))
+DRIFT_FAILURES = int(os.environ.get("DRIFT_FAILURES", 2))
+HEAL_INTERVAL = float(os.environ.get("HEAL_INTERVAL", 60))
+SSDP_LISTEN = os.environ.get("SSDP_LISTEN", "1") == "1"
+OFFLINE_AFTER = float(os.environ.get("OFFLINE_AFTER", 120))
+OFFLINE_POLL_INTERVAL = float(os.environ.get("OFFLINE_POLL_INTERVAL", 30))
+TOMBSTONE_AFTER = float(os.environ.get("TOMBSTONE_AFTER", 86400))
+DEVICE_RETENTION = float(os.environ.get("DEVICE_RETENTION", 30 * 86400))
+EVENT_BUFFER = 500
+WARM_CONCURRENCY = int(os.environ.get("WARM_CONCURRENCY", 16))
+WARM_RATE = float(os.environ.get("WARM_RATE", 50))
+PERSIST_DEBOUNCE = float(os.environ.get("PERSIST_DEBOUNCE", 5))
+LAST_SEEN_RESOLUTION = 300
+SCHEDULE_PRECISION = float(os.environ.get("SCHEDULE_PRECISION", 1))
+SCHEDULE_CONCURRENCY = int(os.environ.get("SCHEDULE_CONCURRENCY", 32))
+SCHEDULE_SPREAD = float(os.environ.get("SCHEDULE_SPREAD", 0))
+SCHEDULE_RATE = float(os.environ.get("SCHEDULE_RATE", 0))
+SCHEDULE_RETRY_WINDOW = float(os.environ.get("SCHEDULE_RETRY_WINDOW", 1800))
+SCHEDULE_RETRY_BASE = 5
+SCHEDULE_RETRY_MAX = 300
+SCHEDULE_CATCHUP_WINDOW = float(os.environ.get("SCHEDULE_CATCHUP_WINDOW", 900))  # how late a missed firing may still run
+SCHEDULE_GRACE = 60  # a firing this late is still on time, as the old minute match allowed
+SCHEDULER_RECHECK = 30  # longest scheduler sleep, so solar times that failed to fetch are retried
+TIMER_SAVE_INTERVAL = 1  # timers.json is rewritten at most this often while timers change
 
 # --- PATH SETUP ---
 if sys.platform == "win32":
@@ -35,6 +83,10 @@ if not os.path.exists(APP_DATA_DIR):
 SCHEDULE_FILE = os.path.join(APP_DATA_DIR, "schedules.json")
 SETTINGS_FILE = os.path.join(APP_DATA_DIR, "settings.json")
 DEVICES_FILE = os.path.join(APP_DATA_DIR, "devices.json")
+JOURNAL_FILE = os.path.join(APP_DATA_DIR, "devices.journal")
+RETRIES_FILE = os.path.join(APP_DATA_DIR, "retries.json")
+SCHEDULER_STATE_FILE = os.path.join(APP_DATA_DIR, "scheduler.json")
+TIMERS_FILE = os.path.join(APP_DATA_DIR, "timers.json")
 
 # --- LOGGING ---
 logging.basicConfig(
@@ -58,9 +110,182 @@ for handler in logging.root.handlers:
 
 app = Flask(__name__)
 
+# --- DEVICE REGISTRY ---
+def device_key(udn=None, serial=None, name=None):
+    # Serial is stable across renames and is also what the cache file has
+    if serial and serial != "Unknown": return serial
+    return udn or name
+
+DEVICE_TYPES = ("switch", "dimmer")
+REACHABILITY_STATES = ("online", "degraded", "offline", "tombstoned", "deleted")
+
+def interned(value, known):
+    """Returns the shared constant equal to value, so records never carry their own copy."""
+    for constant in known:
+        if value == constant: return constant
+    return sys.intern(value) if isinstance(value, str) else value
+
+class DeviceRecord:
+    """Registry entry with fixed slots; never modified once published, replace() returns a new one.
+    Reads like the dict it replaced: record["name"], record.get("ip", "")."""
+    __slots__ = ("key", "name", "udn", "handle", "ip", "port", "mac", "serial", "state", "type", "last_seen",
+                 "reachability", "failures", "healing")
+
+    def __init__(self, key=None, name=None, udn=None, handle=None, ip=None, port=None, mac=None, serial=None, state=0, type="switch",
+                 last_seen=0.0, reachability=None, failures=0, healing=False):
+        self.key = key; self.name = name; self.udn = udn; self.handle = handle
+        self.ip = ip; self.port = port; self.mac = mac; self.serial = serial
+        self.state = int(state or 0); self.type = interned(type or "switch", DEVICE_TYPES)
+        self.last_seen = float(last_seen or 0); self.reachability = interned(reachability, REACHABILITY_STATES)
+        self.failures = failures; self.healing = healing
+
+    def replace(self, **fields):
+        values = {field: getattr(self, field) for field in self.__slots__}
+        values.update(fields)
+        return DeviceRecord(**values)
+
+    def __getitem__(self, field):
+        try: return getattr(self, field)
+        except AttributeError: raise KeyError(field) from None
+
+    def get(self, field, default=None):
+        value = getattr(self, field, None)
+        return default if value is None else value
+
+    def to_api(self):
+        return {"id": self.key, "name": self.name, "ip": self.ip, "state": self.state, "mac": self.mac,
+                "serial": self.serial, "type": self.type, "last_seen": self.last_seen, "reachability": self.reachability or "online"}
+
+    def to_cache(self):
+        # The handle follows re-probes, so it has the current port
+        port = self.handle.port if self.handle else self.port
+        return {"name": self.name, "udn": self.udn, "ip": self.ip, "port": port, "mac": self.mac, "serial": self.serial,
+                "state": self.state, "type": self.type, "last_seen": self.last_seen}
+
+    @classmethod
+    def from_cache(cls, name, data):
+        """Stub for a cached device: no handle until it is rehydrated."""
+        return cls(name=name, udn=data.get("udn"), ip=data.get("ip"), port=data.get("port"), mac=data.get("mac"), serial=data.get("serial"),
+                   state=data.get("state", 0), type=data.get("type", "switch"), last_seen=data.get("last_seen", 0),
+                   reachability=initial_reachability(data.get("last_seen", 0)))
+
+class RegistrySnapshot:
+    """Immutable view of the registry at one version; readers can hold it without locks."""
+    __slots__ = ("version", "entries")
+
+    def __init__(self, version, entries):
+        self.version = version; self.entries = entries
+
+    def get(self, key): return self.entries.get(key)
+
+    def items(self): return self.entries.items()
+
+    def values(self): return self.entries.values()
+
+    def keys(self): return self.entries.keys()
+
+    def __contains__(self, key): return key in self.entries
+
+    def __len__(self): return len(self.entries)
+
+class DeviceRegistry:
+    """Registry entries keyed by serial (UDN when there is none), indexed by name and UDN.
+    Writers replace entries under the lock; readers take a lock-free snapshot()."""
+    INDEXED = ("name", "udn")
+    PERSISTED = ("name", "udn", "handle", "ip", "port", "mac", "serial", "state", "type", "last_seen")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.entries = {}
+        self.indexes = {field: {} for field in self.INDEXED}
+        self.version = 0
+        self._snapshot = RegistrySnapshot(0, types.MappingProxyType({}))
+        self.on_change = None
+
+    def _index(self, key, entry):
+        for field in self.INDEXED:
+            value = entry.get(field)
+            if value: self.indexes[field].setdefault(value, set()).add(key)
+
+    def _unindex(self, key, entry):
+        for field in self.INDEXED:
+            keys = self.indexes[field].get(entry.get(field))
+            if keys is None: continue
+            keys.discard(key)
+            if not keys: del self.indexes[field][entry.get(field)]
+
+    def put(self, key, entry):
+        """Publishes a new DeviceRecord under key; the record must not be shared yet."""
+        with self.lock:
+            old = self.entries.get(key)
+            if old: self._unindex(key, old)
+            entry.key = key
+            self.entries[key] = entry; self.version += 1
+            self._index(key, entry)
+        if self.on_change: self.on_change(key)
+        return entry
+
+    def update(self, key, **fields):
+        """Publishes a new version of the entry with fields changed. Writes to an
+        entry that has been removed in the meantime are dropped."""
+        with self.lock:
+            old = self.entries.get(key)
+            if old is None: return None
+            entry = old.replace(**fields)
+            reindex = not fields.keys().isdisjoint(self.INDEXED)
+            if reindex: self._unindex(key, old)
+            self.entries[key] = entry; self.version += 1
+            if reindex: self._index(key, entry)
+        if self.on_change and not fields.keys().isdisjoint(self.PERSISTED): self.on_change(key)
+        return entry
+
+    def remove(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry: self._unindex(key, entry); self.version += 1
+        if entry and self.on_change: self.on_change(key)
+        return entry
+
+    def snapshot(self):
+        snap = self._snapshot
+        if snap.version == self.version: return snap
+        with self.lock:
+            if self._snapshot.version != self.version:
+                self._snapshot = RegistrySnapshot(self.version, types.MappingProxyType(dict(self.entries)))
+            return self._snapshot
+
+    def get(self, key): return self.entries.get(key)
+
+    def find(self, udn=None, serial=None):
+        entry = self.entries.get(device_key(udn, serial))
+        if entry or not udn: return entry
+        return next(iter(self.lookup("udn", udn)), None)
+
+    def lookup(self, field, value):
+        with self.lock: return [self.entries[k] for k in self.indexes[field].get(value, ())]
+
+    def resolve(self, ref):
+        """Finds an entry by key or friendly name; a name shared by several devices
+        resolves to the one seen most recently."""
+        entry = self.entries.get(ref)
+        if entry: return entry
+        matches = self.lookup("name", ref)
+        return max(matches, key=lambda e: e.get("last_seen", 0)) if matches else None
+
+    def items(self): return self.snapshot().items()
+
+    def values(self): return self.snapshot().values()
+
+    def keys(self): return self.snapshot().keys()
+
+    def __contains__(self, key): return key in self.entries
+
+    def __len__(self): return len(self.entries)
+
 # --- GLOBAL STATE ---
-device_registry = {}
+device_registry = DeviceRegistry()
 scan_status = "Idle"
+last_scan = {}
 settings = {}
 solar_times = {}
 
@@ -72,43 +297,130 @@ def load_json(path, default=None):
         try: 
             with open(path, 'r') as f: 
                 return json.load(f)
-        except: 
-            pass
+        except Exception as e: 
+            logger.error(f"Failed to load {path}: {e}")
     return default
 
+def write_atomic(path, text):
+    # Temp file then rename, so a crash leaves either the old file or the new one
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(text); f.flush(); os.fsync(f.fileno())
+    os.replace(tmp, path)
+
 def save_json(path, data):
     try: 
-        with open(path, 'w') as f: 
-            json.dump(data, f, indent=2)
+        write_atomic(path, json.dumps(data, indent=2))
     except Exception as e: 
         logger.error(f"Failed to save JSON: {e}")
 
-def save_device_cache():
-    cache_data = {}
-    for name, data in device_registry.items():
-        cache_data[name] = {
-            "ip": data.get("ip"),
-            "mac": data.get("mac"),
-            "serial": data.get("serial"),
-            "state": data.get("state", 0),
-            "type": data.get("type", "switch"),
-            "last_seen": data.get("last_seen", 0)
-        }
-    save_json(DEVICES_FILE, cache_data)
-
 def load_device_cache():
-    global device_registry
-    cache = load_json(DEVICES_FILE, {})
-    for name, data in cache.items():
-        device_registry[name] = {
-            "obj": None,
-            "ip": data.get("ip"),
-            "mac": data.get("mac"),
-            "serial": data.get("serial"),
-            "state": data.get("state", 0),
-            "type": data.get("type", "switch"),
-            "last_seen": data.get("last_seen", 0)
-        }
+    """Merges cached devices into the registry. Only devices the registry does not
+    know yet get a stub; live entries are never replaced."""
+    cache = device_store.load()
+    merged = 0
+    for ref, data in cache.items():
+        # Older cache files are keyed by friendly name and carry no name field
+        name = data.get("name") or ref
+        key = device_key(data.get("udn"), data.get("serial"), name)
+        if ref != key: device_store.mark(ref)
+        if key in device_registry: continue
+        merged += 1
+        device_registry.put(key, DeviceRecord.from_cache(name, data))
+    return merged
+
+# --- DEVICE PERSISTENCE ---
+def same_on_disk(old, new):
+    """True when new need not be written: nothing changed but a small last_seen step."""
+    if old is None or new is None: return old is new
+    if any(old.get(field) != value for field, value in new.items() if field != "last_seen"): return False
+    return abs(new["last_seen"] - old.get("last_seen", 0)) < LAST_SEEN_RESOLUTION
+
+class DeviceStore:
+    """Write-behind persistence for the registry: devices.json snapshot plus an
+    append-only devices.journal of changed records, compacted when it outgrows the snapshot."""
+    COMPACT_MIN = 1000
+
+    def __init__(self, snapshot_path, journal_path):
+        self.snapshot_path = snapshot_path; self.journal_path = journal_path
+        self.lock = threading.Lock()
+        self.io_lock = threading.Lock()
+        self.dirty = set()
+        self.wake = threading.Event()
+        self.persisted = {}  # key -> record as it is on disk
+        self.journal_lines = 0
+        self.written = 0; self.compactions = 0; self.last_flush = None
+
+    def mark(self, key):
+        with self.lock: self.dirty.add(key)
+        self.wake.set()
+
+    def load(self):
+        """Snapshot plus journal replay. The journal is cut back to its last good
+        line, so a line torn by a crash mid-append is not appended onto later."""
+        with self.io_lock:
+            data = load_json(self.snapshot_path, {}); lines = 0; good = 0
+            try:
+                with open(self.journal_path, 'rb+') as f:
+                    for line in f:
+                        try:
+                            if not line.endswith(b"\n"): raise ValueError("torn line")
+                            change = json.loads(line); key, value = change["k"], change["v"]
+                        except (ValueError, KeyError, TypeError):
+                            logger.warning(f"Device journal truncated at unreadable line {lines + 1}"); break
+                        if value is None: data.pop(key, None)
+                        else: data[key] = value
+                        lines += 1; good += len(line)
+                    f.truncate(good)
+            except OSError: pass
+            self.persisted = dict(data); self.journal_lines = lines
+            return data
+
+    def flush(self):
+        with self.io_lock:
+            with self.lock: keys, self.dirty = self.dirty, set()
+            changes = []
+            for key in keys:
+                record = device_registry.get(key)
+                new = record.to_cache() if record else None
+                if not same_on_disk(self.persisted.get(key), new): changes.append((key, new))
+            if changes:
+                with open(self.journal_path, 'a') as f:
+                    f.write("".join(json.dumps({"k": key, "v": new}, separators=(",", ":")) + "\n" for key, new in changes))
+                    f.flush(); os.fsync(f.fileno())
+                for key, new in changes:
+                    if new is None: self.persisted.pop(key, None)
+                    else: self.persisted[key] = new
+                self.journal_lines += len(changes); self.written += len(changes)
+            self.last_flush = time.time()
+            if self.journal_lines > max(self.COMPACT_MIN, len(self.persisted)): self.compact()
+
+    def compact(self):
+        # Caller holds io_lock. A crash between the rename and the truncate only
+        # means the journal is replayed over a snapshot that already has it.
+        write_atomic(self.snapshot_path, json.dumps(self.persisted, indent=2))
+        open(self.journal_path, 'w').close()
+        self.journal_lines = 0; self.compactions += 1
+
+    def run(self):
+        while True:
+            self.wake.wait(); time.sleep(PERSIST_DEBOUNCE); self.wake.clear()
+            try: self.flush()
+            except Exception as e: logger.error(f"Failed to persist devices: {e}")
+
+    def close(self):
+        """Final flush and compaction on shutdown, so the next boot reads one file."""
+        try:
+            self.flush()
+            with self.io_lock: self.compact()
+        except Exception as e: logger.error(f"Failed to persist devices: {e}")
+
+    def metrics(self):
+        return {"journal_lines": self.journal_lines, "records_written": self.written, "compactions": self.compactions,
+                "pending": len(self.dirty), "last_flush": self.last_flush}
+
+device_store = DeviceStore(DEVICES_FILE, JOURNAL_FILE)
+device_registry.on_change = device_store.mark
 
 def get_solar_times():
     global solar_times
@@ -130,6 +442,470 @@ def get_solar_times():
         return solar_times
     except: return None
 
+# --- DEMAND TRACKING ---
+class ConsumerTracker:
+    """Tracks who needs live device state so the poller can idle when nobody does."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.last_request = 0.0
+        self.open_streams = 0
+
+    def active(self):
+        if self.open_streams > 0: return True
+        return (time.time() - self.last_request) < CONSUMER_TTL
+
+    def touch(self):
+        was_idle = not self.active()
+        self.last_request = time.time()
+        if was_idle: self.wake.set()
+
+    def stream_opened(self):
+        """Claims a stream slot; False once MAX_STREAMS are open."""
+        with self.lock:
+            if self.open_streams >= MAX_STREAMS: return False
+            self.open_streams += 1
+            if self.open_streams == 1: self.wake.set()
+            return True
+
+    def stream_closed(self):
+        with self.lock: self.open_streams = max(0, self.open_streams - 1)
+
+    def poll_interval(self):
+        return POLL_INTERVAL if self.active() else IDLE_POLL_INTERVAL
+
+    def sleep(self):
+        # Returns early when a consumer shows up while we are idling
+        self.wake.wait(self.poll_interval())
+        self.wake.clear()
+
+    def status(self):
+        return {
+            "mode": "active" if self.active() else "idle",
+            "interval": self.poll_interval(),
+            "streams": self.open_streams,
+            "last_request": self.last_request
+        }
+
+consumers = ConsumerTracker()
+
+# --- DEVICE I/O MAILBOXES ---
+# Priority lanes, most urgent first
+LANE_INTERACTIVE = 0
+LANE_SCHEDULED = 1
+LANE_POLL = 2
+LANE_DISCOVERY = 3
+LANE_NAMES = ["interactive", "scheduled", "poll", "discovery"]
+
+def percentile(samples, pct):
+    if not samples: return 0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class DeviceWorker:
+    """Mailbox for a single device: one SOAP request at a time, most urgent lane first,
+    with duplicate queued reads merged."""
+    def __init__(self, key, io):
+        self.key = key
+        self.io = io
+        self.heap = []
+        self.lock = threading.Condition()
+        self.thread = None
+        self.pending_reads = {}
+        self.served = 0; self.merged = 0; self.errors = 0; self.max_depth = 0
+        self.busy_time = 0.0; self.last_service = 0.0
+        self.read_latency = collections.deque(maxlen=200)
+        self.hedges = 0; self.hedge_wins = 0; self.hedge_tokens = 0.0; self.hedging = False
+        self.current = None  # future of the item the worker thread is running
+
+    def submit(self, fn, lane, read=None):
+        with self.lock:
+            pending = self.pending_reads.get(read)
+            if read and pending is not None and pending[0] <= lane:
+                self.merged += 1
+                return pending[1]
+            future = concurrent.futures.Future()
+            if read: self.pending_reads[read] = (lane, future)
+            else:
+                for kind, (pending_lane, _) in list(self.pending_reads.items()):
+                    if lane >= pending_lane: del self.pending_reads[kind]
+            heapq.heappush(self.heap, (lane, next(self.io.seq), time.time(), fn, future, read))
+            self.max_depth = max(self.max_depth, len(self.heap))
+            self.lock.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True, name=f"io-{self.key}")
+                self.thread.start()
+        return future
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.lock.wait_for(lambda: self.heap, WORKER_IDLE_TIMEOUT):
+                    # Idle workers exit; submit() starts a new one on demand
+                    self.thread = None; return
+                # Preemption is per device: the heap puts this device's commands ahead of
+                # its own background work, and a command retrying elsewhere holds nothing up here
+                lane, _, queued_at, fn, future, read = heapq.heappop(self.heap)
+                pending = self.pending_reads.get(read)
+                if pending and pending[1] is future: del self.pending_reads[read]
+            if not future.set_running_or_notify_cancel():
+                self.io.finished(lane, queued_at); continue
+            start = time.time(); self.current = future
+            try: result, error = fn(), None
+            except Exception as e: result, error = None, e; self.errors += 1
+            elapsed = time.time() - start
+            self.served += 1; self.busy_time += elapsed; self.last_service = elapsed
+            self.io.finished(lane, queued_at)
+            # A hedged read's backup may already have answered
+            try:
+                if error is None: future.set_result(result)
+                else: future.set_exception(error)
+            except concurrent.futures.InvalidStateError: pass
+
+    def timed_read(self, fn):
+        start = time.time(); result = fn()
+        self.read_latency.append(time.time() - start)
+        return result
+
+    def hedged(self, fn):
+        """Runs an idempotent read on the worker thread; if it is still out after this
+        device's observed p95, a second copy races it on hedge_pool and whichever
+        answers first resolves the caller's future. Hedges are limited to one in
+        flight and to HEDGE_BUDGET of the device's reads."""
+        self.hedge_tokens = min(1.0, self.hedge_tokens + HEDGE_BUDGET)
+        if not HEDGE_READS or len(self.read_latency) < HEDGE_MIN_SAMPLES: return self.timed_read(fn)
+        future = self.current; backups = []
+        def landed(backup):
+            self.hedging = False
+            if backup.exception() is not None: return
+            try: future.set_result(backup.result()); self.hedge_wins += 1
+            except concurrent.futures.InvalidStateError: pass
+        def launch():
+            if future.done() or self.hedging or self.hedge_tokens < 1: return
+            self.hedge_tokens -= 1; self.hedges += 1; self.hedging = True
+            backup = hedge_pool.submit(fn); backups.append(backup); backup.add_done_callback(landed)
+        deadline = hedge_timer.arm(percentile(self.read_latency, 95), launch)
+        try: return self.timed_read(fn)
+        except Exception:
+            # The primary failed; a backup still out may yet answer
+            if backups: return backups[0].result()
+            raise
+        finally: hedge_timer.disarm(deadline)
+
+    def metrics(self):
+        samples = list(self.read_latency)
+        return {
+            "queue_depth": len(self.heap),
+            "max_depth": self.max_depth,
+            "served": self.served,
+            "merged_reads": self.merged,
+            "errors": self.errors,
+            "avg_service_ms": round(1000 * self.busy_time / self.served, 1) if self.served else 0,
+            "last_service_ms": round(1000 * self.last_service, 1),
+            "read_p50_ms": round(1000 * percentile(samples, 50), 1),
+            "read_p95_ms": round(1000 * percentile(samples, 95), 1),
+            "read_p99_ms": round(1000 * percentile(samples, 99), 1),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins
+        }
+
+class DeviceIO:
+    def __init__(self):
+        self.workers = {}
+        self.lock = threading.Lock()
+        self.seq = itertools.count()
+        self.latency = [collections.deque(maxlen=500) for _ in LANE_NAMES]
+
+    def worker(self, key):
+        with self.lock:
+            if key not in self.workers: self.workers[key] = DeviceWorker(key, self)
+            return self.workers[key]
+
+    def read(self, key, kind, fn, lane=LANE_POLL, hedge=False):
+        worker = self.worker(key)
+        if hedge: return worker.submit(lambda: worker.hedged(fn), lane, read=kind)
+        return worker.submit(fn, lane, read=kind)
+
+    def command(self, key, fn, lane=LANE_INTERACTIVE): return self.worker(key).submit(fn, lane)
+
+    def discard(self, key):
+        with self.lock: self.workers.pop(key, None)
+
+    def finished(self, lane, queued_at):
+        self.latency[lane].append(time.time() - queued_at)
+
+    def lane_metrics(self):
+        out = {}
+        for lane, name in enumerate(LANE_NAMES):
+            samples = list(self.latency[lane])
+            out[name] = {
+                "count": len(samples),
+                "p50_ms": round(1000 * percentile(samples, 50), 1),
+                "p90_ms": round(1000 * percentile(samples, 90), 1),
+                "p99_ms": round(1000 * percentile(samples, 99), 1)
+            }
+        return out
+
+    def metrics(self):
+        with self.lock: workers = list(self.workers.values())
+        return {w.key: w.metrics() for w in workers}
+
+class DeadlineTimer:
+    """One thread running callbacks at deadlines, so arming a hedge for every read
+    costs a heap push rather than a thread."""
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.heap = []
+        self.seq = itertools.count()
+        self.thread = None
+
+    def arm(self, delay, fn):
+        entry = [time.time() + delay, next(self.seq), fn]
+        with self.cond:
+            heapq.heappush(self.heap, entry); self.cond.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True, name="deadlines"); self.thread.start()
+        return entry
+
+    def disarm(self, entry): entry[2] = None
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.heap or self.heap[0][0] > time.time():
+                    self.cond.wait(self.heap[0][0] - time.time() if self.heap else None)
+                fn = heapq.heappop(self.heap)[2]
+            if fn is None: continue
+            try: fn()
+            except Exception as e: logger.error(f"Deadline callback failed: {e}")
+
+device_io = DeviceIO()
+# Only hedge backups run here; primaries stay on their device's worker thread
+hedge_pool = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+hedge_timer = DeadlineTimer()
+
+# --- HTTP SESSIONS ---
+class CountingConnection(urllib3.connection.HTTPConnection):
+    pool = None
+
+    def connect(self):
+        super().connect()
+        if self.pool: self.pool.opened += 1
+
+class CountingPool(urllib3.HTTPConnectionPool):
+    """Counts real TCP connects, including urllib3's silent reconnects."""
+    ConnectionCls = CountingConnection
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened = 0
+
+    def _new_conn(self):
+        conn = super()._new_conn()
+        conn.pool = self
+        return conn
+
+class PooledSession(Session):
+    """pywemo Session that keeps its connections to the device open between calls."""
+    def __init__(self, url):
+        super().__init__(url)
+        self.lock = threading.Lock()
+        self.pool = None
+        self.last_used = 0.0
+        self.requests = 0; self.connections = 0
+
+    def get_pool(self):
+        with self.lock:
+            now = time.time()
+            if self.pool and (now - self.last_used > HTTP_IDLE_TIMEOUT or (self.pool.host, self.pool.port) != (self.host, self.port)):
+                self.close_pool()
+            if self.pool is None:
+                self.pool = CountingPool(self.host, self.port, maxsize=HTTP_POOL_SIZE, retries=self.retries, timeout=self.timeout)
+            self.last_used = now; self.requests += 1
+            return self.pool
+
+    def close_pool(self):
+        if self.pool:
+            self.connections += self.pool.opened
+            self.pool.close(); self.pool = None
+
+    def reap(self):
+        with self.lock:
+            if self.pool and time.time() - self.last_used > HTTP_IDLE_TIMEOUT: self.close_pool()
+
+    def request(self, method, url, retries=None, timeout=None, **kwargs):
+        pool = self.get_pool()
+        if not pool.is_same_host(url): return super().request(method, url, retries=retries, timeout=timeout, **kwargs)
+        try:
+            # Origin-form target (/upnp/...), as pywemo's PoolManager sends; Wemo's server never saw absolute-form
+            response = pool.request(method, urllib3.util.parse_url(url).request_uri, retries=self.retries if retries is None else retries, timeout=self.timeout if timeout is None else timeout, **kwargs)
+            if response.status != 200: raise HTTPNotOkException(f"Received status {response.status} for {url}")
+        except urllib3.exceptions.HTTPError as err:
+            raise HTTPException(err) from err
+        response.content = response.data
+        return response
+
+    def metrics(self):
+        with self.lock: opened = self.connections + (self.pool.opened if self.pool else 0)
+        return {
+            "endpoint": f"{self.host}:{self.port}",
+            "requests": self.requests,
+            "connections": opened,
+            "reuse_ratio": round(1 - opened / self.requests, 3) if self.requests else 0
+        }
+
+class SessionPool:
+    """One PooledSession per device (by UDN), shared by every caller in the server."""
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, url):
+        # A device seen at a new endpoint gets a fresh session; the old one goes
+        # away with the handle that is being replaced
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None or session.url != url:
+                if session:
+                    with session.lock: session.close_pool()
+                session = self.sessions[key] = PooledSession(url)
+            return session
+
+    def reap(self):
+        with self.lock: sessions = list(self.sessions.values())
+        for session in sessions: session.reap()
+
+    def metrics(self):
+        with self.lock: sessions = dict(self.sessions)
+        out = {key: session.metrics() for key, session in sessions.items()}
+        requests_total = sum(m["requests"] for m in out.values())
+        opened = sum(m["connections"] for m in out.values())
+        return {
+            "pool_size": HTTP_POOL_SIZE,
+            "idle_timeout": HTTP_IDLE_TIMEOUT,
+            "reuse_ratio": round(1 - opened / requests_total, 3) if requests_total else 0,
+            "sessions": out
+        }
+
+http_sessions = SessionPool()
+
+# --- BASICEVENT FAST PATH ---
+BASICEVENT_URN = "urn:Belkin:service:basicevent:1"
+BASICEVENT_PATH = "/upnp/control/basicevent1"
+SOAP_ENVELOPE = ('<?xml version="1.0" encoding="utf-8"?>'
+                 '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+                 '<s:Body><u:{action} xmlns:u="' + BASICEVENT_URN + '">{args}</u:{action}></s:Body></s:Envelope>')
+GET_STATE_BODY = SOAP_ENVELOPE.format(action="GetBinaryState", args="").encode()
+SET_STATE_BODIES = [SOAP_ENVELOPE.format(action="SetBinaryState", args=f"<BinaryState>{i}</BinaryState>").encode() for i in (0, 1)]
+BRIGHTNESS_BODIES = [SOAP_ENVELOPE.format(action="SetBinaryState", args=f"<BinaryState>1</BinaryState><brightness>{i}</brightness>").encode() for i in range(101)]
+STATE_RE = re.compile(rb"<BinaryState>(\d+)")
+FAULT_MARKER = b"Fault>"
+# Polls are repeated every cycle anyway, so a dead address should fail in seconds,
+# not sit through pywemo's minute-long retry schedule
+POLL_RETRIES = urllib3.Retry(total=1, backoff_factor=0.5, allowed_methods=["POST"])
+
+def soap_headers(action):
+    return {"Content-Type": "text/xml", "SOAPACTION": f'"{BASICEVENT_URN}#{action}"'}
+
+class FastBasicEvent:
+    """Lean client for the hot BasicEvent actions: canned SOAP envelopes and a regex,
+    no fully built pywemo device needed."""
+    GET_HEADERS = soap_headers("GetBinaryState")
+    SET_HEADERS = soap_headers("SetBinaryState")
+
+    def __init__(self, host, port, device_type="switch", session=None, control_path=BASICEVENT_PATH):
+        self.session = session or PooledSession(f"http://{host}:{port}/setup.xml")
+        self.device_type = device_type
+        self.control_path = control_path
+
+    def call(self, headers, body, retries=None):
+        url = f"http://{self.session.host}:{self.session.port}{self.control_path}"
+        data = self.session.post(url, headers=headers, body=body, retries=retries).data
+        if FAULT_MARKER in data: raise ActionException(f"SOAP fault from {url}")
+        return data
+
+    def get_state(self, force_update=True, retries=None):
+        match = STATE_RE.search(self.call(self.GET_HEADERS, GET_STATE_BODY, retries))
+        return int(match.group(1)) if match else 0
+
+    def set_state(self, state):
+        self.call(self.SET_HEADERS, SET_STATE_BODIES[1 if state else 0])
+
+    def on(self): self.set_state(1)
+
+    def off(self): self.set_state(0)
+
+    def toggle(self): self.set_state(not self.get_state())
+
+    def set_brightness(self, level):
+        # Same contract as pywemo's Dimmer: 1-100, and 0 means off
+        level = max(0, min(100, int(level)))
+        if level: self.call(self.SET_HEADERS, BRIGHTNESS_BODIES[level])
+        else: self.off()
+
+# --- DEVICE HANDLES ---
+class DeviceHandle:
+    """Control-only view of a Wemo: identity, endpoint and control URLs. The pywemo
+    device it was built from, with every parsed service description, is not kept."""
+    __slots__ = ("name", "udn", "serial", "mac", "device_type", "control_urls", "session", "fast")
+
+    def __init__(self, name, host, port, udn, serial="", mac="", device_type="switch", control_urls=None):
+        self.name = name; self.udn = udn; self.serial = serial; self.mac = mac
+        self.device_type = device_type
+        self.control_urls = control_urls or {"basicevent": BASICEVENT_PATH}
+        self.session = http_sessions.get(udn or host, f"http://{host}:{port}/setup.xml")
+        self.fast = FastBasicEvent(host, port, device_type, session=self.session, control_path=self.control_urls.get("basicevent", BASICEVENT_PATH))
+
+    # The session owns the endpoint, so a re-probe moves every caller at once
+    @property
+    def host(self): return self.session.host
+
+    @property
+    def port(self): return self.session.port
+
+    @property
+    def setup_url(self): return f"http://{self.host}:{self.port}/setup.xml"
+
+    @classmethod
+    def from_device(cls, dev):
+        control_urls = {}
+        for name, service in getattr(dev, 'services', {}).items():
+            try: control_urls[name] = urllib.parse.urlparse(service.controlURL).path
+            except Exception: pass
+        device_type = "dimmer" if isinstance(dev, Dimmer) else "switch"
+        return cls(dev.name, dev.host, dev.port, getattr(dev, 'udn', ''), getattr(dev, 'serial_number', 'Unknown'),
+                   getattr(dev, 'mac', 'Unknown'), device_type, control_urls)
+
+    @classmethod
+    def from_description(cls, url, timeout=5):
+        """Builds a handle from setup.xml alone, without fetching service descriptions."""
+        from pywemo.ouimeaux_device.api.xsd_types import DeviceDescription
+        desc = DeviceDescription.from_xml(requests.get(url, timeout=timeout).content)
+        control_urls = {svc.service_type.split(":")[-2]: svc.control_url for svc in desc._services}
+        if "basicevent" not in control_urls: return None
+        parsed = urllib.parse.urlparse(url)
+        device_type = "dimmer" if desc.udn.startswith("uuid:Dimmer") else "switch"
+        return cls(desc.name, parsed.hostname, parsed.port or 80, desc.udn, desc.serial_number, desc.mac, device_type, control_urls)
+
+    def reprobe(self):
+        """Looks for the device on the other Wemo ports. True if it moved."""
+        from pywemo.ouimeaux_device import probe_wemo, PROBE_PORTS
+        ports = [p for p in PROBE_PORTS if p != self.port]
+        port = probe_wemo(self.host, ports, probe_timeout=3, match_udn=self.udn or None)
+        if port is None: return False
+        logger.info(f"{self.name} moved to port {port}")
+        self.session.url = f"http://{self.host}:{port}/setup.xml"
+        return True
+
+def device_call(entry, op, *args):
+    """Runs a BasicEvent operation on the fast path. A device that stopped
+    answering is re-probed on its other ports once before giving up."""
+    handle = entry["handle"]
+    try: return getattr(handle.fast, op)(*args)
+    except HTTPException:
+        if not handle.reprobe(): raise
+        return getattr(handle.fast, op)(*args)
+
 # --- DEEP SCANNER ---
 class DeepScanner:
     def probe_port(self, ip, ports=[49152, 49153, 49154, 49155], timeout=0.6):
@@ -141,7 +917,6 @@ class DeepScanner:
         return None
 
     def scan_subnet(self, subnets):
-        import pywemo
         found_ips = []; all_hosts = []
         for subnet in subnets:
             try:
@@ -161,52 +936,329 @@ class DeepScanner:
                 try:
                     url = f"http://{ip}:{port}/setup.xml"
                     try:
-                        dev = pywemo.discovery.device_from_description(url)
+                        dev = DeviceHandle.from_description(url)
                         if dev: devices.append(dev); break
                     except: pass
                 except: pass
         return devices
 
+# --- IP DRIFT HEALING ---
+SSDP_GROUP = ("239.255.255.250", 1900)
+
+def normalize_mac(mac):
+    """Lowercase hex digits only; also pads BSD arp's "0:11:..." octets."""
+    mac = (mac or "").lower()
+    if ":" in mac: mac = "".join(part.zfill(2) for part in mac.split(":"))
+    return re.sub(r"[^0-9a-f]", "", mac)
+
+def neighbor_table():
+    """MAC -> IP from the OS neighbor (ARP) cache."""
+    table = {}
+    try:
+        with open("/proc/net/arp") as f:
+            for line in f.readlines()[1:]:
+                parts = line.split()
+                if len(parts) >= 4 and parts[2] != "0x0": table[normalize_mac(parts[3])] = parts[0]
+        return table
+    except OSError: pass
+    try:
+        out = subprocess.run(["arp", "-an"], capture_output=True, text=True, timeout=3).stdout
+        for ip, mac in re.findall(r"\(([\d.]+)\) at ([0-9a-fA-F:]+)", out): table[normalize_mac(mac)] = ip
+    except Exception: pass
+    return table
+
+class SSDPListener:
+    """Passively records the LOCATION of every SSDP NOTIFY on the LAN, so a
+    device that comes back on a new DHCP lease can be found without a search."""
+    MAX_ENTRIES = 1024
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.locations = collections.OrderedDict()  # udn -> (location, seen)
+        self.running = False
+
+    def start(self):
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"): sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(("", SSDP_GROUP[1]))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, struct.pack("4sl", socket.inet_aton(SSDP_GROUP[0]), socket.INADDR_ANY))
+        except OSError as e:
+            logger.warning(f"SSDP listener disabled: {e}"); return
+        self.running = True
+        threading.Thread(target=self.run, args=(sock,), daemon=True).start()
+
+    def run(self, sock):
+        from pywemo.ssdp import UPNPEntry
+        errors = 0
+        while True:
+            try: data = sock.recv(2048).decode(errors="replace"); errors = 0
+            except OSError as e:
+                # A broken socket fails every recv; back off, then give up rather than spin
+                errors += 1
+                if errors >= 10:
+                    logger.warning(f"SSDP listener stopped: {e}"); self.running = False; sock.close(); return
+                time.sleep(errors); continue
+            if not data.startswith("NOTIFY"): continue
+            # Anything on the LAN can send these; a malformed one must not end the thread
+            try: entry = UPNPEntry.from_response(data); udn, location = entry.udn, entry.location
+            except Exception as e: logger.debug(f"Ignoring malformed SSDP NOTIFY: {e}"); continue
+            if not (udn.startswith("uuid:") and location): continue
+            self.record(udn, location)
+            try: on_announce(udn, location)
+            except Exception as e: logger.warning(f"SSDP announce from {udn} failed: {e}")
+
+    def record(self, udn, location):
+        with self.lock:
+            self.locations[udn] = (location, time.time()); self.locations.move_to_end(udn)
+            while len(self.locations) > self.MAX_ENTRIES: self.locations.popitem(last=False)
+
+    def location_for(self, udn, max_age=SCAN_INTERVAL):
+        with self.lock: location, seen = self.locations.get(udn, (None, 0))
+        return location if time.time() - seen < max_age else None
+
+ssdp_listener = SSDPListener()
+
+def heal_device(key, location=None):
+    """Finds a device that stopped answering at its old address: an announced
+    location if one was passed, the neighbor table by MAC, recent SSDP
+    announcements, then one SSDP search for its UDN. A candidate is only
+    accepted after its setup.xml confirms the same device. True if found."""
+    entry = device_registry.get(key)
+    if not entry: return False
+    handle = entry.get("handle")
+    current = handle.setup_url if handle else None
+    try:
+        candidates = [location] if location else []
+        ip = neighbor_table().get(normalize_mac(entry.get("mac")))
+        if ip and ip != entry.get("ip"): candidates.append(f"http://{ip}:{handle.port if handle else 49153}/setup.xml")
+        recent = ssdp_listener.location_for(entry.get("udn"))
+        if recent and recent != current: candidates.append(recent)
+        if not candidates and entry.get("udn"):
+            import pywemo
+            candidates.extend(e.location for e in pywemo.ssdp.scan(timeout=3, max_entries=1, match_udn=entry["udn"]) if e.location)
+        for url in candidates:
+            try: found = DeviceHandle.from_description(url, timeout=3)
+            except Exception: continue
+            if found and device_key(found.udn, found.serial, found.name) == key:
+                register_device(found)
+                if url != current: logger.info(f"Rehomed {entry['name']} from {entry.get('ip')} to {found.host}:{found.port}")
+                return True
+        return False
+    finally:
+        device_registry.update(key, healing=False)
+
+def schedule_heal(key, location=None):
+    """Queues a heal on the device's discovery lane unless one is already pending.
+    An announced location is always worth checking, so it gets its own read."""
+    with device_registry.lock:
+        entry = device_registry.get(key)
+        if entry is None or (entry.get("healing") and not location): return
+        device_registry.update(key, healing=True); heal_at[key] = time.time()
+    device_io.read(key, "announce" if location else "heal", lambda: heal_device(key, location), LANE_DISCOVERY)
+
+# --- REACHABILITY ---
+# online -> degraded on the first failed read, degraded -> offline once nothing
+# has answered for OFFLINE_AFTER, offline -> tombstoned after TOMBSTONE_AFTER.
+# Any successful read, scan hit or verified announcement goes straight back to
+# online. Tombstoned entries are only deleted after DEVICE_RETENTION.
+# poll: seconds between reads (0 = every poller cycle, None = never)
+# heal: seconds between heal attempts (None = only on SSDP announcements)
+REACHABILITY_POLICY = {
+    "online": {"poll": 0, "heal": None},
+    "degraded": {"poll": 0, "heal": HEAL_INTERVAL},
+    "offline": {"poll": OFFLINE_POLL_INTERVAL, "heal": HEAL_INTERVAL},
+    "tombstoned": {"poll": None, "heal": None},
+}
+reachability_events = collections.deque(maxlen=EVENT_BUFFER)
+event_seq = itertools.count(1)
+# Scheduling times by key, kept out of the records so they don't publish a new registry version
+next_poll = {}
+heal_at = {}
+
+def forget_device(key):
+    device_registry.remove(key); device_io.discard(key)
+    next_poll.pop(key, None); heal_at.pop(key, None)
+
+def initial_reachability(last_seen):
+    """State for an entry restored from cache, before anything has been verified."""
+    return "tombstoned" if time.time() - (last_seen or 0) > TOMBSTONE_AFTER else "offline"
+
+def set_reachability(key, state, reason):
+    with device_registry.lock:
+        entry = device_registry.get(key)
+        if entry is None or entry.get("reachability") == state: return
+        previous = entry.get("reachability")
+        device_registry.update(key, reachability=state); next_poll.pop(key, None)
+    reachability_events.append({"seq": next(event_seq), "time": time.time(), "id": key, "name": entry.get("name"),
+                                "from": previous, "to": state, "reason": reason})
+    if previous: logger.info(f"{entry.get('name')}: {previous} -> {state} ({reason})")
+
+def events_since(seq):
+    return [e for e in list(reachability_events) if e["seq"] > seq]
+
+def note_success(key, **fields):
+    device_registry.update(key, last_seen=time.time(), failures=0, **fields)
+    set_reachability(key, "online", "read ok")
+
+def note_failure(key):
+    """Counts a failed read, moves the entry down the state machine and queues a
+    heal when the state's policy allows one."""
+    with device_registry.lock:
+        entry = device_registry.get(key)
+        if entry is None: return
+        entry = device_registry.update(key, failures=entry.get("failures", 0) + 1)
+    state = entry.get("reachability", "online")
+    if state == "online": set_reachability(key, "degraded", "read failed")
+    elif state == "degraded" and time.time() - entry.get("last_seen", 0) > OFFLINE_AFTER:
+        set_reachability(key, "offline", f"no answer for {int(OFFLINE_AFTER)}s")
+    entry = device_registry.get(key)
+    heal = REACHABILITY_POLICY[entry.get("reachability", "online")]["heal"] if entry else None
+    if heal is None or entry["failures"] < DRIFT_FAILURES: return
+    if time.time() - heal_at.get(key, 0) >= heal: schedule_heal(key)
+
+def sweep_reachability():
+    """Ages silent entries: offline to tombstoned, and tombstoned past retention out
+    of the registry. Returns the number of entries deleted."""
+    now = time.time(); removed = 0
+    for key, entry in device_registry.items():
+        silent = now - entry.get("last_seen", 0)
+        state = entry.get("reachability", "online")
+        if state in ("degraded", "offline") and silent > TOMBSTONE_AFTER:
+            set_reachability(key, "tombstoned", f"no answer for {int(TOMBSTONE_AFTER)}s")
+        elif state == "tombstoned" and silent > DEVICE_RETENTION:
+            set_reachability(key, "deleted", "retention expired")
+            forget_device(key); removed += 1
+    return removed
+
+def on_announce(udn, location):
+    """An SSDP NOTIFY from a device we have given up polling brings it straight back."""
+    entry = device_registry.find(udn, None)
+    if entry and entry.get("reachability") in ("offline", "tombstoned"): schedule_heal(entry["key"], location)
+
 # --- BACKGROUND TASKS ---
 def register_device(dev):
-    global device_registry
+    """Reconciles a discovered device against the registry by serial/UDN. An entry
+    whose endpoint is unchanged keeps its handle (and with it the session and any
+    per-device state); only a moved device gets a new one. Returns (key, outcome)
+    with outcome one of "added", "changed" or "unchanged"."""
     try:
-        mac = getattr(dev, 'mac', 'Unknown')
-        serial = getattr(dev, 'serial_number', 'Unknown')
-        # [NEW] Check if device is a dimmer
-        is_dimmer = isinstance(dev, Dimmer)
-        
-        device_registry[dev.name] = {
-            "obj": dev,
-            "ip": dev.host,
-            "mac": mac,
-            "serial": serial,
-            "state": 0,
-            "type": "dimmer" if is_dimmer else "switch",
-            "last_seen": time.time()
-        }
+        is_handle = isinstance(dev, DeviceHandle)
+        udn = getattr(dev, 'udn', '')
+        serial = dev.serial if is_handle else getattr(dev, 'serial_number', 'Unknown')
+        entry = device_registry.find(udn, serial)
+        current = entry.get("handle") if entry else None
+        if current and (current.host, current.port) == (dev.host, dev.port):
+            current.name = dev.name
+            device_registry.update(entry["key"], name=dev.name, last_seen=time.time(), failures=0)
+            set_reachability(entry["key"], "online", "discovered")
+            return entry["key"], "unchanged"
+        # Keep only the control handle; the pywemo object is released after this
+        handle = dev if is_handle else DeviceHandle.from_device(dev)
+        key = device_key(handle.udn, handle.serial, handle.name)
+        if entry and entry["key"] != key: forget_device(entry["key"])
+        device_registry.put(key, DeviceRecord(
+            name=handle.name, udn=handle.udn, handle=handle, ip=handle.host, port=handle.port, mac=handle.mac, serial=handle.serial,
+            state=entry.get("state", 0) if entry else 0, type=handle.device_type, last_seen=time.time(),
+            reachability=entry.get("reachability") if entry else None))
+        set_reachability(key, "online", "moved" if current else "discovered")
+        return key, "changed" if entry else "added"
     except Exception as e:
         logger.error(f"Error registering device {dev}: {e}")
+        return None, None
+
+def rehydrate_device(ip, port=None, timeout=5):
+    ports = [49153, 49152, 49154, 49155]
+    if port: ports = [port] + [p for p in ports if p != port]  # last known port first
+    for p in ports:
+        try:
+            handle = DeviceHandle.from_description(f"http://{ip}:{p}/setup.xml", timeout=timeout)
+            if handle: register_device(handle); return handle
+        except: pass
+    return None
+
+class WarmStart:
+    """Boot-time hydration of cached devices in parallel, bounded by WARM_CONCURRENCY and WARM_RATE."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = False
+        self.total = self.done = self.hydrated = 0
+        self.started = self.finished = None
+
+    def run(self):
+        stubs = sorted((r for r in device_registry.values() if r.handle is None and r.ip), key=lambda r: -r.last_seen)
+        with self.lock:
+            self.active = True; self.total = len(stubs); self.done = self.hydrated = 0
+            self.started = time.time(); self.finished = None
+        budget = threading.Semaphore(WARM_CONCURRENCY)
+        futures = []
+        for i, record in enumerate(stubs):
+            budget.acquire()
+            delay = self.started + i / WARM_RATE - time.time()
+            if delay > 0: time.sleep(delay)
+            future = device_io.read(record.key, "rehydrate", lambda r=record: rehydrate_device(r.ip, r.port, timeout=2), LANE_DISCOVERY)
+            future.add_done_callback(lambda f: self.finish_one(f, budget))
+            futures.append(future)
+        concurrent.futures.wait(futures)
+        with self.lock: self.active = False; self.finished = time.time()
+        logger.info(f"Warm start: {self.hydrated}/{self.total} cached devices back in {self.finished - self.started:.1f}s")
+
+    def finish_one(self, future, budget):
+        budget.release()
+        with self.lock:
+            self.done += 1
+            if future.exception() is None and future.result(): self.hydrated += 1
+
+    def status(self):
+        with self.lock:
+            end = self.finished or time.time()
+            return {"active": self.active, "total": self.total, "done": self.done, "hydrated": self.hydrated,
+                    "progress": round(self.done / self.total, 3) if self.total else 1.0,
+                    "elapsed": round(end - self.started, 1) if self.started else 0}
+
+warm_start = WarmStart()
+
+def refresh_state(key, entry, lane=LANE_POLL):
+    """Queues a state read on the device mailbox; the entry is updated when it lands."""
+    def on_done(future):
+        if future.exception() is None:
+            note_success(key, state=future.result())
+        else: note_failure(key)
+    # Resolve the entry when the read runs: the device may have been rehomed since
+    future = device_io.read(key, "state", lambda: device_call(device_registry.get(key) or entry, "get_state", True, POLL_RETRIES), lane, hedge=True)
+    future.add_done_callback(on_done)
+    return future
+
+def apply_scan(found):
+    """Applies one scan's results to the registry as a diff."""
+    diff = {"added": [], "changed": [], "unchanged": [], "gone": []}
+    seen = set()
+    for dev in found:
+        key, outcome = register_device(dev)
+        if key is None or key in seen: continue
+        seen.add(key); diff[outcome].append(device_registry.get(key)["name"])
+    diff["gone"] = [k for k in device_registry.keys() if k not in seen]
+    return diff
 
 def run_scan_cycle():
-    global scan_status, device_registry
+    global scan_status, device_registry, last_scan
     if scan_status != "Idle": return
     try:
         scan_status = "Scanning..."
         import pywemo
         ds = DeepScanner()
-        load_device_cache()
-        devices = pywemo.discover_devices()
-        for dev in devices: register_device(dev)
+        found = list(pywemo.discover_devices())
         subs = settings.get("subnets", [])
         if subs:
             scan_status = "Deep Scanning..."
-            deep_devs = ds.scan_subnet(subs)
-            for dev in deep_devs: register_device(dev)
-        now = time.time()
-        to_remove = [n for n, d in device_registry.items() if (now - d.get("last_seen", 0)) > 900]
-        for name in to_remove: del device_registry[name]
-        save_device_cache()
+            found.extend(ds.scan_subnet(subs))
+        diff = apply_scan(found)
+        removed = sweep_reachability()
+        last_scan = {"time": time.time(), **{k: len(v) for k, v in diff.items()}, "evicted": removed}
+        logger.info(f"Scan Complete: {len(diff['added'])} added, {len(diff['changed'])} changed, {len(diff['unchanged'])} unchanged, {len(diff['gone'])} gone ({removed} evicted)")
+        diff["gone"] = [device_registry.get(k)["name"] for k in diff["gone"] if k in device_registry]
+        if diff["added"] or diff["changed"]: logger.info(f"Scan diff: added {diff['added']}, changed {diff['changed']}")
         scan_status = "Idle"
     except Exception as e:
         logger.error(f"Scan Error: {e}"); scan_status = "Error"
@@ -216,61 +1268,640 @@ def scanner_loop():
 
 def poller_loop():
     while True:
-        keys = list(device_registry.keys())
-        for name in keys:
-            entry = device_registry[name]
-            dev = entry.get("obj")
-            if dev:
-                try:
-                    state = dev.get_state(force_update=True)
-                    entry['state'] = state
-                    entry['last_seen'] = time.time()
-                except: pass
-            else:
-                ip = entry.get("ip")
-                if ip:
-                    for p in [49153, 49152, 49154, 49155]:
-                        try:
-                            url = f"http://{ip}:{p}/setup.xml"
-                            import pywemo
-                            new_dev = pywemo.discovery.device_from_description(url)
-                            if new_dev: register_device(new_dev); break
-                        except: pass
-        time.sleep(2)
-
-def scheduler_loop():
-    while True:
+        now = time.time()
+        for key, entry in device_registry.items():
+            interval = REACHABILITY_POLICY[entry.get("reachability", "online")]["poll"]
+            if interval is None or entry.get("healing") or now < next_poll.get(key, 0): continue
+            next_poll[key] = now + interval
+            if entry.get("handle"): refresh_state(key, entry)
+            elif entry.get("ip"): device_io.read(key, "rehydrate", lambda ip=entry["ip"], port=entry.get("port"): rehydrate_device(ip, port), LANE_DISCOVERY)
+        sweep_reachability()
+        http_sessions.reap()
+        consumers.sleep()
+
+# --- SCHEDULE STORE ---
+class FileWatcher:
+    """Calls on_change when a file is written or replaced: inotify where available, else an mtime poll."""
+    IN_CLOSE_WRITE = 0x008; IN_MOVED_TO = 0x080; IN_CREATE = 0x100; IN_DELETE = 0x200
+
+    def __init__(self, path, on_change):
+        self.path = path; self.on_change = on_change
+        self.mode = None
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        fd = self.inotify_fd()
+        if fd is None: self.mode = "mtime"; self.poll_mtime()
+        else: self.mode = "inotify"; self.read_events(fd)
+
+    def inotify_fd(self):
         try:
-            now = datetime.datetime.now(); today_str = now.strftime("%Y-%m-%d"); weekday = now.weekday(); current_hhmm = now.strftime("%H:%M")
-            solar = get_solar_times()
-            current_schedules = load_json(SCHEDULE_FILE, []); schedule_modified = False
-            for job in current_schedules:
-                job_days = job.get('days', [])
-                if not job_days or weekday not in job_days: continue
-                trigger_time = ""
-                if job['type'] == "Time (Fixed)": trigger_time = job['value']
-                elif solar:
-                    base = solar['sunrise'] if job['type'] == "Sunrise" else solar['sunset']
-                    try:
-                        dt = datetime.datetime.strptime(f"{today_str} {base}", "%Y-%m-%d %H:%M")
-                        trigger_time = (dt + datetime.timedelta(minutes=int(job['value']) * int(job.get('offset_dir', 1)))).strftime("%H:%M")
-                    except: continue
-                if trigger_time == current_hhmm and job.get('last_run') != today_str:
-                    entry = device_registry.get(job['device'])
-                    if entry and entry.get("obj"):
-                        dev = entry["obj"]
-                        try:
-                            action = job['action']
-                            if action == "Turn ON": dev.on()
-                            elif action == "Turn OFF": dev.off()
-                            elif action == "Toggle": dev.toggle()
-                            entry['state'] = dev.get_state(force_update=True)
-                            logger.info(f"Executed Schedule: {job['device']} -> {action}")
-                        except Exception as e: logger.error(f"Failed to execute schedule for {job['device']}: {e}")
-                    job['last_run'] = today_str; schedule_modified = True
-            if schedule_modified: save_json(SCHEDULE_FILE, current_schedules)
-        except Exception as e: logger.error(f"Scheduler error: {e}")
-        time.sleep(30)
+            import ctypes, ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init()
+            if fd < 0: return None
+            mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+            if libc.inotify_add_watch(fd, os.path.dirname(self.path).encode(), mask) < 0: os.close(fd); return None
+            return fd
+        except (OSError, AttributeError): return None
+
+    def read_events(self, fd):
+        name = os.path.basename(self.path).encode()
+        while True:
+            data = os.read(fd, 4096); offset = 0; hit = False
+            while offset + 16 <= len(data):
+                _, _, _, length = struct.unpack_from("iIII", data, offset)
+                hit = hit or data[offset + 16:offset + 16 + length].rstrip(b"\0") == name
+                offset += 16 + length
+            if hit: self.on_change()
+
+    def poll_mtime(self):
+        last = file_stamp(self.path)
+        while True:
+            time.sleep(1)
+            stamp = file_stamp(self.path)
+            if stamp != last: last = stamp; self.on_change()
+
+def file_stamp(path):
+    try: st = os.stat(path); return (st.st_mtime_ns, st.st_size)
+    except OSError: return None
+
+class ScheduleStore:
+    """The server's copy of schedules.json, re-read only when the file changes under us.
+    The job list is replaced on every change, so readers need no lock."""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.jobs = []
+        self.version = 0
+        self.stamp = None
+        self.listeners = []
+        self.watcher = FileWatcher(path, self.reload)
+
+    def load(self):
+        self.reload(); self.watcher.start()
+
+    def reload(self):
+        with self.lock:
+            stamp = file_stamp(self.path)
+            if stamp == self.stamp: return
+            try:
+                if stamp is None: jobs = []  # deleted: no schedules
+                else:
+                    with open(self.path) as f: jobs = json.load(f)
+            except (OSError, ValueError) as e:
+                # Likely caught mid-write by an editor; the next change event retries
+                logger.error(f"Failed to load {self.path}: {e}"); return
+            self.jobs = jobs if isinstance(jobs, list) else []; self.stamp = stamp; self.version += 1
+        logger.info(f"Loaded {len(self.jobs)} schedules")
+        self.changed()
+
+    def get(self): return self.jobs
+
+    def save(self):
+        # Caller holds the lock
+        save_json(self.path, self.jobs); self.stamp = file_stamp(self.path)
+
+    def add(self, job):
+        with self.lock: self.jobs = self.jobs + [job]; self.version += 1; self.save()
+        self.changed()
+
+    def delete(self, job_id):
+        with self.lock: self.jobs = [j for j in self.jobs if j.get('id') != job_id]; self.version += 1; self.save()
+        self.changed()
+
+    def mark_run(self, job_ids, day):
+        """Records last_run without bumping the version; it does not change when anything fires."""
+        with self.lock:
+            for job in self.jobs:
+                if job.get('id') in job_ids: job['last_run'] = day
+            self.save()
+
+    def changed(self):
+        for listener in self.listeners: listener()
+
+schedule_store = ScheduleStore(SCHEDULE_FILE)
+
+# --- SCHEDULER ---
+def wall_clock(day, second):
+    """Epoch time of a second of day on the local clock. Unlike midnight + second
+    this stays right on the days DST changes."""
+    hours, rest = divmod(second, 3600)
+    return datetime.datetime.combine(day, datetime.time(hours, *divmod(rest, 60))).timestamp()
+
+class CompiledRule:
+    """A daily schedule in normalized form: the second of day it fires (seconds from
+    the solar anchor for Sunrise/Sunset rules), a weekday bitmask and the job itself."""
+    __slots__ = ("job", "anchor", "second", "days")
+
+    def __init__(self, job, anchor, second, days):
+        self.job = job; self.anchor = anchor; self.second = second; self.days = days
+
+    def fire_second(self, solar_minutes):
+        if self.anchor is None: return self.second
+        base = solar_minutes.get(self.anchor)
+        # Offsets past midnight wrap, as the old HH:MM match did
+        return None if base is None else (base * 60 + self.second) % 86400
+
+CRON_MONTHS = {name: i + 1 for i, name in enumerate("jan feb mar apr may jun jul aug sep oct nov dec".split())}
+CRON_WEEKDAYS = {name: i for i, name in enumerate("sun mon tue wed thu fri sat".split())}
+
+def cron_field(text, low, high, names={}):
+    """Sorted values a cron field allows: *, lists, ranges, /steps and names."""
+    value = lambda v: names[v] if v in names else int(v)
+    values = set()
+    for part in text.lower().split(","):
+        part, _, step = part.partition("/")
+        first, _, last = part.partition("-")
+        if part == "*": start, end = low, high
+        else: start = value(first); end = value(last) if last else high if step else start
+        step = int(step) if step else 1
+        if not low <= start <= end <= high or step < 1: raise ValueError(f"bad cron field {text!r}")
+        values.update(range(start, end + 1, step))
+    return sorted(values)
+
+class CronRule:
+    """A "Cron" schedule: "min hour dom month dow", optionally with a leading seconds field."""
+    __slots__ = ("job", "days", "seconds", "minutes", "dom", "months", "dow", "either")
+
+    def __init__(self, job, expr, days):
+        fields = expr.split()
+        if len(fields) == 5: fields = ["0"] + fields
+        if len(fields) != 6: raise ValueError(f"bad cron expression {expr!r}")
+        seconds, minutes, hours, dom, months, dow = fields
+        self.job = job; self.days = days
+        self.seconds = cron_field(seconds, 0, 59)
+        self.minutes = [h * 60 + m for h in cron_field(hours, 0, 23) for m in cron_field(minutes, 0, 59)]
+        self.dom = set(cron_field(dom, 1, 31)); self.months = set(cron_field(months, 1, 12, CRON_MONTHS))
+        self.dow = {d % 7 for d in cron_field(dow, 0, 7, CRON_WEEKDAYS)}
+        # As in Vixie cron, when both day fields are restricted either one matching is enough
+        self.either = dom != "*" and dow != "*"
+
+    def on(self, day):
+        if day.month not in self.months or not self.days & 1 << day.weekday(): return False
+        dom, dow = day.day in self.dom, day.isoweekday() % 7 in self.dow
+        return (dom or dow) if self.either else (dom and dow)
+
+    def next_after(self, ts):
+        """The first firing after ts, or None if there is none within five years."""
+        moment = datetime.datetime.fromtimestamp(ts); day = moment.date()
+        minute, second = divmod(moment.hour * 3600 + moment.minute * 60 + moment.second + 1, 60)
+        for _ in range(5 * 366):
+            if self.on(day):
+                i = bisect.bisect_left(self.minutes, minute)
+                if i < len(self.minutes) and self.minutes[i] == minute:
+                    j = bisect.bisect_left(self.seconds, second)
+                    if j < len(self.seconds): return wall_clock(day, minute * 60 + self.seconds[j])
+                    i += 1
+                if i < len(self.minutes): return wall_clock(day, self.minutes[i] * 60 + self.seconds[0])
+            day += datetime.timedelta(days=1); minute = second = 0
+        return None
+
+    def last_between(self, start, end):
+        """The latest firing in (start, end], or None."""
+        moment = datetime.datetime.fromtimestamp(end); day = moment.date()
+        minute, second = moment.hour * 60 + moment.minute, moment.second
+        while wall_clock(day + datetime.timedelta(days=1), 0) > start:
+            if self.on(day):
+                i = bisect.bisect_right(self.minutes, minute) - 1
+                if i >= 0 and self.minutes[i] == minute:
+                    j = bisect.bisect_right(self.seconds, second) - 1
+                    if j >= 0: at = wall_clock(day, minute * 60 + self.seconds[j]); return at if at > start else None
+                    i -= 1
+                if i >= 0: at = wall_clock(day, self.minutes[i] * 60 + self.seconds[-1]); return at if at > start else None
+            day -= datetime.timedelta(days=1); minute, second = 1439, 59
+        return None
+
+def compile_rule(job):
+    """CompiledRule or CronRule for a schedules.json job, or None when it cannot be parsed.
+    Fixed times take HH:MM or HH:MM:SS; solar offsets are minutes and may be fractional."""
+    try:
+        days = 0
+        for day in job.get('days', []): days |= 1 << int(day)
+        if job['type'] == "Cron": return CronRule(job, job['value'], days)
+        if job['type'] == "Time (Fixed)":
+            parts = [int(part) for part in job['value'].split(":")]
+            if len(parts) not in (2, 3) or not 0 <= parts[0] < 24 or not all(0 <= part < 60 for part in parts[1:]): return None
+            hours, minutes, seconds = parts + [0] * (3 - len(parts))
+            return CompiledRule(job, None, hours * 3600 + minutes * 60 + seconds, days)
+        anchor = "sunrise" if job['type'] == "Sunrise" else "sunset"
+        return CompiledRule(job, anchor, round(float(job['value']) * 60) * int(job.get('offset_dir', 1)), days)
+    except (KeyError, TypeError, ValueError, AttributeError): return None
+
+def solar_minutes(solar):
+    minutes = {}
+    for anchor in ("sunrise", "sunset"):
+        try:
+            hours, mins = solar[anchor].split(":"); minutes[anchor] = int(hours) * 60 + int(mins)
+        except (KeyError, TypeError, ValueError): pass
+    return minutes
+
+SCHEDULE_OPS = {"Turn ON": "on", "Turn OFF": "off", "Toggle": "toggle"}
+
+def pacing_policy(job):
+    """(spread seconds, commands per second) for a job: its own "spread"/"rate"
+    if set, else the schedule_spread/schedule_rate settings. 0 means no limit."""
+    spread = job.get('spread', settings.get('schedule_spread', SCHEDULE_SPREAD))
+    rate = job.get('rate', settings.get('schedule_rate', SCHEDULE_RATE))
+    try: return max(0.0, float(spread or 0)), max(0.0, float(rate or 0))
+    except (TypeError, ValueError): return 0.0, 0.0
+
+def retry_action(entry, op, task):
+    """A retried action reads the device first and only sets what is still
+    missing, so an attempt that landed but was reported as failed is not
+    repeated. A Toggle targets the opposite of the state it was first aimed at."""
+    state = bool(device_call(entry, "get_state"))
+    if op != "toggle": target = op == "on"
+    else:
+        if task["from_state"] is None: task["from_state"] = int(state)
+        target = not task["from_state"]
+    if state == target: return "already set"
+    device_call(entry, "set_state", int(target))
+
+class JobDispatcher:
+    """Runs due schedule actions on their devices' mailboxes, paced and concurrent,
+    retrying failures with backoff."""
+    def __init__(self, retries_path):
+        self.retries_path = retries_path
+        self.lock = threading.Lock()
+        self.cond = threading.Condition()
+        self.pending = []  # heap of (start_at, seq, task)
+        self.seq = itertools.count()
+        self.next_slot = 0.0
+        self.retrying = {}  # seq -> task waiting for a retry
+        self.inflight = threading.BoundedSemaphore(SCHEDULE_CONCURRENCY)
+        self.latencies = collections.deque(maxlen=500)
+        self.results = {}  # job id -> outcome of its last run
+        self.last_batch = None
+        self.ok = 0; self.failed = 0; self.retried = 0  # failed: gave up for good
+
+    def dispatch(self, jobs):
+        now = time.time()
+        batch = {"jobs": len(jobs), "started": now, "pending": len(jobs), "failed": 0, "paced_over": 0.0, "duration": None}
+        policies = [pacing_policy(job) for job in jobs]
+        sizes = collections.Counter(policies); seen = collections.Counter()
+        try: global_rate = max(0.0, float(settings.get('schedule_rate', SCHEDULE_RATE) or 0))
+        except (TypeError, ValueError): global_rate = 0.0
+        with self.cond:
+            for job, policy in zip(jobs, policies):
+                (spread, rate), i = policy, seen[policy]; seen[policy] += 1
+                at = now + max(spread * i / sizes[policy], i / rate if rate else 0.0)
+                if global_rate:
+                    at = max(at, self.next_slot); self.next_slot = at + 1 / global_rate
+                batch["paced_over"] = round(max(batch["paced_over"], at - now), 3)
+                task = {"job": job, "batch": batch, "attempt": 1, "due": now, "from_state": None}
+                heapq.heappush(self.pending, (at, next(self.seq), task))
+            self.cond.notify()
+
+    def load_retries(self):
+        """Re-queues the retries a previous run left behind, if still inside the window."""
+        now = time.time()
+        for task in load_json(self.retries_path, []):
+            if now - task.get("due", 0) > SCHEDULE_RETRY_WINDOW:
+                logger.error(f"Gave up on schedule for {task['job'].get('device')}: retry window passed while stopped"); continue
+            self.requeue({**task, "batch": None}, max(now, task.get("at", now)))
+
+    def requeue(self, task, at):
+        with self.cond:
+            seq = next(self.seq); task["at"] = at
+            self.retrying[seq] = task
+            heapq.heappush(self.pending, (at, seq, task)); self.cond.notify()
+            self.save_retries()
+
+    def save_retries(self):
+        # Caller holds cond
+        save_json(self.retries_path, [{k: v for k, v in task.items() if k != "batch"} for task in self.retrying.values()])
+
+    def run(self):
+        self.load_retries()
+        while True:
+            with self.cond:
+                while not self.pending or self.pending[0][0] > time.time():
+                    self.cond.wait(self.pending[0][0] - time.time() if self.pending else None)
+                _, seq, task = heapq.heappop(self.pending)
+                # Stays in retries.json until it has an outcome
+                if seq in self.retrying: task["seq"] = seq
+            self.start(task)
+
+    def start(self, task):
+        job = task["job"]
+        entry = device_registry.resolve(job['device'])
+        if not entry or not entry.get("handle"):
+            self.outcome(task, 0.0, "device not found"); return
+        op = SCHEDULE_OPS.get(job.get('action'))
+        # A Toggle always goes through retry_action so from_state comes from a live read,
+        # never from the poller's cached state
+        if task["attempt"] == 1 and op != "toggle": fn = lambda: op and device_call(entry, op)
+        else: fn = lambda: op and retry_action(entry, op, task)
+        self.inflight.acquire()
+        future = device_io.command(entry["key"], fn, LANE_SCHEDULED)
+        future.add_done_callback(lambda f, started=time.time(): self.landed(f, task, entry, started))
+
+    def landed(self, future, task, entry, started):
+        self.inflight.release()
+        error = future.exception()
+        if error is None: refresh_state(entry["key"], entry, LANE_SCHEDULED)
+        self.outcome(task, time.time() - started, error)
+
+    def outcome(self, task, latency, error):
+        job = task["job"]; now = time.time()
+        delay = min(SCHEDULE_RETRY_BASE * 2 ** (task["attempt"] - 1), SCHEDULE_RETRY_MAX)
+        retry = error is not None and now + delay - task["due"] <= SCHEDULE_RETRY_WINDOW
+        status = "ok" if error is None else "retrying" if retry else "gave up"
+        with self.lock:
+            self.results[job.get('id')] = {"time": now, "latency": round(latency, 3), "ok": error is None, "status": status,
+                                           "attempts": task["attempt"], "error": str(error) if error else None}
+            if error is None: self.ok += 1; self.latencies.append(latency)
+            elif not retry: self.failed += 1
+            if retry: self.retried += 1
+            batch = task.get("batch")
+            done = False
+            if batch and task["attempt"] == 1:
+                # Batches report the first pass; retries are counted on their own
+                if error: batch["failed"] += 1
+                batch["pending"] -= 1
+                done = batch["pending"] == 0
+                if done: batch["duration"] = round(now - batch["started"], 3); self.last_batch = batch
+        if "seq" in task:
+            with self.cond: self.retrying.pop(task.pop("seq"), None); self.save_retries()
+        attempt = f" (attempt {task['attempt']})" if task["attempt"] > 1 else ""
+        if error is None: logger.info(f"Executed Schedule: {job['device']} -> {job.get('action')}{attempt} ({latency * 1000:.0f}ms)")
+        elif retry: logger.warning(f"Schedule for {job['device']} failed{attempt}: {error}; retrying in {delay:.0f}s")
+        else: logger.error(f"Failed to execute schedule for {job['device']}{attempt}: {error}; giving up")
+        if done and batch["jobs"] > 1: logger.info(f"Schedule batch of {batch['jobs']} finished in {batch['duration']}s, paced over {batch['paced_over']}s ({batch['failed']} failed)")
+        if retry: self.requeue({**task, "attempt": task["attempt"] + 1}, now + delay)
+
+    def metrics(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            return {"concurrency": SCHEDULE_CONCURRENCY, "queued": len(self.pending), "retrying": len(self.retrying),
+                    "ok": self.ok, "failed": self.failed, "retries": self.retried,
+                    "latency_p50": percentile(latencies, 50), "latency_p95": percentile(latencies, 95),
+                    "last_batch": self.last_batch, "jobs": dict(self.results)}
+
+job_dispatcher = JobDispatcher(RETRIES_FILE)
+
+def late_verdict(job, lag, what):
+    """How a firing lag seconds late is handled. Within SCHEDULE_GRACE it is "on
+    time"; later it was missed while the server was down or stalled and is
+    "caught up" if within SCHEDULE_CATCHUP_WINDOW, else "dropped". A Toggle is
+    "suppressed": after the fact it would flip a device from a state nobody chose."""
+    if lag <= SCHEDULE_GRACE: return "on time"
+    if lag > SCHEDULE_CATCHUP_WINDOW:
+        logger.warning(f"Missed {what}: {lag:.0f}s late, outside the catch-up window"); return "dropped"
+    if SCHEDULE_OPS.get(job.get('action')) == 'toggle':
+        logger.info(f"Not catching up {what}: {lag:.0f}s late, toggle"); return "suppressed"
+    logger.info(f"Catching up {what}: {lag:.0f}s late"); return "caught up"
+
+class TimerScheduler:
+    """Fires schedule rules from a sorted daily index (cron rules from a heap),
+    sleeping until the next firing and catching up after restarts or stalls."""
+    def __init__(self, state_path):
+        self.cond = threading.Condition()
+        self.rules = []; self.crons = []
+        self.rules_version = None
+        self.cron_heap = []; self.cron_seq = itertools.count()
+        self.times = []; self.jobs = []; self.cursor = 0
+        self.index_for = None
+        self.dirty = True
+        self.lags = collections.deque(maxlen=500)
+        self.fired = 0; self.late = 0
+        self.state_path = state_path
+        self.high_water = None; self.saved_at = 0  # firings up to high_water have been taken; kept in scheduler.json
+        self.caught_up = 0; self.suppressed = 0; self.dropped = 0
+
+    def reload(self):
+        """Rules changed; recompile before the next wait."""
+        with self.cond: self.dirty = True; self.cond.notify()
+
+    def compile(self):
+        schedules = schedule_store.get(); self.rules_version = schedule_store.version
+        compiled = [rule for rule in map(compile_rule, schedules) if rule]
+        self.rules = [rule for rule in compiled if isinstance(rule, CompiledRule)]
+        self.crons = [rule for rule in compiled if isinstance(rule, CronRule)]
+
+    def build_index(self, now, solar):
+        """Today's remaining firings, sorted. Up to a minute late still fires, as
+        the old minute match did."""
+        today_str = now.date().isoformat(); bit = 1 << now.weekday()
+        cutoff = now.timestamp() - SCHEDULE_GRACE; minutes = solar_minutes(solar) if solar else {}
+        firings = []
+        for rule in self.rules:
+            if not rule.days & bit or rule.job.get('last_run') == today_str: continue
+            second = rule.fire_second(minutes)
+            at = None if second is None else wall_clock(now.date(), second)
+            if at is None or at <= cutoff: continue
+            firings.append((at, len(firings), rule.job))
+        firings.sort()
+        self.times = [f[0] for f in firings]; self.jobs = [f[2] for f in firings]; self.cursor = 0
+        # Cron rules resume after whatever has already been taken
+        since = max(cutoff, self.high_water or 0)
+        self.cron_heap = [(at, next(self.cron_seq), rule) for rule in self.crons for at in [rule.next_after(since)] if at]
+        heapq.heapify(self.cron_heap)
+
+    def missed(self, since, now, solar):
+        """Firings in (since, now - SCHEDULE_GRACE] that have not run, oldest first.
+        Looks back at most a day, using today's solar times for yesterday; fire()
+        drops those beyond SCHEDULE_CATCHUP_WINDOW."""
+        start = max(since, now.timestamp() - 86400); cutoff = now.timestamp() - SCHEDULE_GRACE
+        minutes = solar_minutes(solar) if solar else {}
+        firings = []; day = datetime.date.fromtimestamp(start)
+        while day <= now.date():
+            bit = 1 << day.weekday(); day_str = day.isoformat()
+            for rule in self.rules:
+                if not rule.days & bit or (rule.job.get('last_run') or '') >= day_str: continue
+                second = rule.fire_second(minutes)
+                at = None if second is None else wall_clock(day, second)
+                if at is not None and start < at <= cutoff: firings.append((at, rule.job))
+            day += datetime.timedelta(days=1)
+        # A cron rule catches up once, for its latest missed occurrence, and not at all
+        # if the heap is about to fire a more recent one
+        for rule in self.crons:
+            at = rule.last_between(start, cutoff)
+            if at and not rule.last_between(cutoff, now.timestamp()): firings.append((at, rule.job))
+        firings.sort(key=lambda f: f[0])
+        return [(job, at) for at, job in firings]
+
+    def refresh(self, now, solar):
+        """Recompiles on a rule change and re-indexes on a rule, day or solar change.
+        Returns the firings a rebuilt index left out since the high-water mark."""
+        day = (now.date(), solar and (solar.get('sunrise'), solar.get('sunset')))
+        with self.cond:
+            if self.dirty or schedule_store.version != self.rules_version:
+                self.dirty = False; self.compile(); self.index_for = None
+            if day == self.index_for: return []
+            self.index_for = day; self.build_index(now, solar)
+            return self.missed(self.high_water, now, solar) if self.high_water else []
+
+    def due(self, now=None):
+        """Takes the (job, time) firings whose time has come."""
+        now = time.time() if now is None else now
+        with self.cond:
+            end = bisect.bisect_right(self.times, now, self.cursor)
+            firings = list(zip(self.jobs[self.cursor:end], self.times[self.cursor:end]))
+            self.cursor = end
+            while self.cron_heap and self.cron_heap[0][0] <= now:
+                at, _, rule = heapq.heappop(self.cron_heap)
+                # Occurrences passed over in a stall collapse into the latest one
+                firings.append((rule.job, rule.last_between(at, now) or at))
+                upcoming = rule.next_after(now)
+                if upcoming: heapq.heappush(self.cron_heap, (upcoming, next(self.cron_seq), rule))
+        return firings
+
+    def fire(self, firings, now):
+        """Dispatches firings, late ones per late_verdict, and records them as run."""
+        jobs = []; days = collections.defaultdict(set)
+        for job, at in firings:
+            lag = now - at
+            # last_run only gates daily rules; marking a cron rule would rewrite schedules.json every firing
+            if job.get('type') != "Cron": days[datetime.date.fromtimestamp(at).isoformat()].add(job.get('id'))
+            verdict = late_verdict(job, lag, f"schedule {job.get('id')} ({job.get('action')} {job.get('device')})")
+            if verdict == "on time":
+                self.lags.append(lag); self.fired += 1
+                if lag > SCHEDULE_PRECISION: self.late += 1
+            elif verdict == "caught up": self.caught_up += 1
+            elif verdict == "dropped": self.dropped += 1; continue
+            else: self.suppressed += 1; continue
+            jobs.append(job)
+        if jobs: job_dispatcher.dispatch(jobs)
+        for day, ids in days.items(): schedule_store.mark_run(ids, day)
+
+    def load_high_water(self):
+        self.high_water = load_json(self.state_path, {}).get('high_water')
+        if self.high_water: logger.info(f"Scheduler high-water mark: {datetime.datetime.fromtimestamp(self.high_water)}")
+
+    def save_high_water(self, force=False):
+        if self.high_water and (force or self.high_water - self.saved_at >= SCHEDULER_RECHECK):
+            save_json(self.state_path, {"high_water": self.high_water}); self.saved_at = self.high_water
+
+    def next_fire(self):
+        upcoming = [self.times[self.cursor]] if self.cursor < len(self.times) else []
+        if self.cron_heap: upcoming.append(self.cron_heap[0][0])
+        return min(upcoming) if upcoming else None
+
+    def wait(self, now):
+        midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time.min).timestamp()
+        with self.cond:
+            wake = min(self.next_fire() or midnight, midnight, time.time() + SCHEDULER_RECHECK)
+            if not self.dirty: self.cond.wait(max(0, wake - time.time()))
+
+    def run(self):
+        self.load_high_water()
+        while True:
+            try:
+                now = datetime.datetime.now(); stamp = now.timestamp()
+                if self.high_water and stamp - self.high_water > SCHEDULER_RECHECK + SCHEDULE_GRACE:
+                    logger.warning(f"Scheduler was stalled or down for {stamp - self.high_water:.0f}s, catching up")
+                firings = self.refresh(now, get_solar_times()) + self.due(stamp)
+                if firings: self.fire(firings, stamp)
+                self.high_water = stamp; self.save_high_water()
+                self.wait(datetime.datetime.now())
+            except Exception as e:
+                logger.error(f"Scheduler error: {e}"); time.sleep(SCHEDULER_RECHECK)
+
+    def metrics(self):
+        with self.cond:
+            lags = list(self.lags)
+            return {"rules": len(self.rules) + len(self.crons), "cron_rules": len(self.crons),
+                    "pending": len(self.times) - self.cursor + len(self.cron_heap), "next_fire": self.next_fire(),
+                    "precision": SCHEDULE_PRECISION, "fired": self.fired, "late": self.late,
+                    "lag_p50": percentile(lags, 50), "lag_p95": percentile(lags, 95), "lag_max": max(lags) if lags else None,
+                    "high_water": self.high_water, "catchup_window": SCHEDULE_CATCHUP_WINDOW,
+                    "caught_up": self.caught_up, "catchup_suppressed": self.suppressed, "catchup_dropped": self.dropped}
+
+timer_scheduler = TimerScheduler(SCHEDULER_STATE_FILE)
+schedule_store.listeners.append(timer_scheduler.reload)
+
+class TimerQueue:
+    """One-shot timers from /api/timers, held in a heap and fired through job_dispatcher."""
+    def __init__(self, path):
+        self.path = path
+        self.cond = threading.Condition()
+        self.timers = {}; self.heap = []
+        self.last_id = 0
+        self.dirty = False; self.saved_at = 0
+        self.lags = collections.deque(maxlen=500)
+        self.fired = 0; self.verdicts = collections.Counter()
+
+    def load(self):
+        with self.cond:
+            for timer in load_json(self.path, []):
+                if isinstance(timer, dict) and timer.get('id') is not None and timer.get('at'): self.timers[timer['id']] = timer
+            self.heap = [(timer['at'], timer_id) for timer_id, timer in self.timers.items()]; heapq.heapify(self.heap)
+            self.last_id = max(self.timers, default=0)
+        if self.timers: logger.info(f"Loaded {len(self.timers)} pending timers")
+
+    def save(self):
+        # Caller holds the lock
+        save_json(self.path, sorted(self.timers.values(), key=lambda timer: timer['at']))
+        self.dirty = False; self.saved_at = time.time()
+
+    def flush(self):
+        with self.cond:
+            if self.dirty: self.save()
+
+    def add(self, device, action, at):
+        with self.cond:
+            self.last_id = max(int(time.time() * 1000), self.last_id + 1)
+            timer = {"id": self.last_id, "device": device, "action": action, "at": at, "created": time.time()}
+            self.timers[timer['id']] = timer; heapq.heappush(self.heap, (at, timer['id']))
+            self.dirty = True; self.cond.notify()
+        return timer
+
+    def cancel(self, timer_id):
+        with self.cond:
+            timer = self.timers.pop(timer_id, None)
+            if timer is None: return None
+            if len(self.heap) > 2 * len(self.timers) + 64:
+                # Mostly cancelled entries; rebuild rather than carry them
+                self.heap = [(t['at'], i) for i, t in self.timers.items()]; heapq.heapify(self.heap)
+            self.dirty = True; self.cond.notify()
+        return timer
+
+    def list(self):
+        with self.cond: return sorted(self.timers.values(), key=lambda timer: timer['at'])
+
+    def due(self, now):
+        # Caller holds the lock
+        timers = []
+        while self.heap and self.heap[0][0] <= now:
+            _, timer_id = heapq.heappop(self.heap)
+            if timer_id in self.timers: timers.append(self.timers.pop(timer_id))
+        if timers: self.dirty = True
+        return timers
+
+    def run(self):
+        while True:
+            try:
+                with self.cond:
+                    now = time.time(); timers = self.due(now)
+                    if self.dirty and now - self.saved_at >= TIMER_SAVE_INTERVAL: self.save()
+                    if not timers:
+                        deadlines = [self.heap[0][0]] if self.heap else []
+                        if self.dirty: deadlines.append(self.saved_at + TIMER_SAVE_INTERVAL)
+                        self.cond.wait(max(0, min(deadlines) - now) if deadlines else None)
+                        continue
+                jobs = []
+                for timer in timers:
+                    lag = now - timer['at']
+                    verdict = late_verdict(timer, lag, f"timer {timer['id']} ({timer['action']} {timer['device']})")
+                    self.verdicts[verdict] += 1
+                    if verdict == "on time": self.lags.append(lag); self.fired += 1
+                    if verdict in ("on time", "caught up"): jobs.append(timer)
+                if jobs: job_dispatcher.dispatch(jobs)
+            except Exception as e:
+                logger.error(f"Timer error: {e}"); time.sleep(1)
+
+    def metrics(self):
+        with self.cond:
+            lags = list(self.lags)
+            return {"pending": len(self.timers), "fired": self.fired, "caught_up": self.verdicts["caught up"],
+                    "suppressed": self.verdicts["suppressed"], "dropped": self.verdicts["dropped"],
+                    "lag_p50": percentile(lags, 50), "lag_p95": percentile(lags, 95), "lag_max": max(lags) if lags else None}
+
+timer_queue = TimerQueue(TIMERS_FILE)
 
 # --- ROUTES ---
 @app.route('/')
@@ -278,52 +1909,83 @@ def index(): return render_template("index.html", version=VERSION)
 
 @app.route('/api/status')
 def api_status():
-    return jsonify({"status": "online", "scan_status": scan_status, "device_count": len(device_registry), "version": VERSION})
+    warming = warm_start.status()
+    return jsonify({"status": "warming" if warming["active"] else "online", "warming": warming, "scan_status": scan_status, "device_count": len(device_registry), "version": VERSION, "polling": consumers.status(), "last_scan": last_scan})
+
+payload_cache = (-1, [])
+
+def devices_payload():
+    # Built once per registry version; every reader in between gets the same list
+    global payload_cache
+    snap = device_registry.snapshot()
+    if payload_cache[0] == snap.version: return payload_cache[1]
+    devs_out = [record.to_api() for record in snap.values()]
+    payload_cache = (snap.version, devs_out)
+    return devs_out
 
 @app.route('/api/devices')
 def api_devices():
-    devs_out = []
-    for name, data in device_registry.items():
-        devs_out.append({
-            "name": name, 
-            "ip": data.get("ip"), 
-            "state": data.get("state", 0),
-            "mac": data.get("mac"),
-            "serial": data.get("serial"),
-            "type": data.get("type", "switch") # [NEW] Return device type
-        })
-    return jsonify(devs_out)
+    consumers.touch()
+    return jsonify(devices_payload())
+
+@app.route('/api/stream')
+def api_stream():
+    # Server-sent events: pushes the device list whenever it changes. A stream holds
+    # its waitress thread while open, so only MAX_STREAMS may be, well below SERVE_THREADS.
+    if not consumers.stream_opened():
+        return jsonify({"status": "busy", "error": "too many open streams"}), 503, {"Retry-After": "30"}
+    def generate():
+        last = None; seq = reachability_events[-1]["seq"] if reachability_events else 0
+        while True:
+            for event in events_since(seq):
+                yield f"event: reachability\ndata: {json.dumps(event)}\n\n"; seq = event["seq"]
+            payload = devices_payload()
+            # last_seen moves on every poll; only push when something else changed
+            seen = json.dumps([{**d, "last_seen": None} for d in payload])
+            if seen != last:
+                yield f"data: {json.dumps(payload)}\n\n"; last = seen
+            else:
+                yield ": keep-alive\n\n"
+            time.sleep(POLL_INTERVAL)
+    response = Response(generate(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+    # Runs when waitress closes the response, even if the generator never started
+    response.call_on_close(consumers.stream_closed)
+    return response
+
+@app.route('/api/events')
+def api_events():
+    # Reachability transitions, oldest first; poll with ?since=<last seq seen>
+    return jsonify(events_since(request.args.get("since", 0, type=int)))
 
 @app.route('/api/toggle/<name>', methods=['POST'])
 def api_toggle(name):
-    entry = device_registry.get(name)
-    if entry and entry.get("obj"):
-        dev = entry["obj"]
-        def toggle_task():
-            try: dev.toggle(); entry['state'] = dev.get_state(force_update=True)
-            except: pass
-        threading.Thread(target=toggle_task).start()
+    entry = device_registry.resolve(name)
+    if entry and entry.get("handle"):
+        device_io.command(entry["key"], lambda: device_call(entry, "toggle"))
+        refresh_state(entry["key"], entry, LANE_INTERACTIVE)
         return jsonify({"status": "ok"})
     return jsonify({"status": "not found"}), 404
 
 # [NEW] Brightness Route
 @app.route('/api/brightness/<name>', methods=['POST'])
 def api_brightness(name):
-    entry = device_registry.get(name)
-    if entry and entry.get("obj"):
-        dev = entry["obj"]
+    entry = device_registry.resolve(name)
+    if entry and entry.get("handle"):
         try:
             level = int(request.json.get('level', 0))
-            def dim_task():
-                try: 
-                    dev.set_brightness(level)
-                    entry['state'] = level
-                except: pass
-            threading.Thread(target=dim_task).start()
+            def on_done(future):
+                if future.exception() is None: device_registry.update(entry["key"], state=level)
+            device_io.command(entry["key"], lambda: device_call(entry, "set_brightness", level)).add_done_callback(on_done)
             return jsonify({"status": "ok"})
         except Exception as e: return jsonify({"status": "error", "error": str(e)}), 400
     return jsonify({"status": "not found"}), 404
 
+@app.route('/api/metrics')
+def api_metrics():
+    devices = device_io.metrics()
+    hedging = {"enabled": HEDGE_READS, "budget": HEDGE_BUDGET, "hedges": sum(d["hedges"] for d in devices.values()), "wins": sum(d["hedge_wins"] for d in devices.values())}
+    return jsonify({"devices": devices, "lanes": device_io.lane_metrics(), "hedging": hedging, "http": http_sessions.metrics(), "persistence": device_store.metrics(), "scheduler": timer_scheduler.metrics(), "schedule_jobs": job_dispatcher.metrics(), "timers": timer_queue.metrics()})
+
 @app.route('/api/settings', methods=['GET', 'POST'])
 def api_settings():
     global settings
@@ -341,8 +2003,7 @@ def api_scan():
 
 @app.route('/api/schedules', methods=['GET', 'POST', 'DELETE'])
 def api_schedules():
-    current = load_json(SCHEDULE_FILE, [])
-    if request.method == 'GET': return jsonify(current)
+    if request.method == 'GET': return jsonify(schedule_store.get())
     if request.method == 'POST':
         data = request.json
         new_job = {
@@ -355,16 +2016,55 @@ def api_schedules():
             "days": data.get('days', [0,1,2,3,4,5,6]),
             "last_run": ""
         }
-        current.append(new_job); save_json(SCHEDULE_FILE, current)
+        # Optional pacing for this rule: spread over N seconds and/or at most M commands per second
+        new_job.update({k: data[k] for k in ("spread", "rate") if data.get(k)})
+        if not compile_rule(new_job): return jsonify({"status": "error", "error": "invalid time, offset or cron expression"}), 400
+        schedule_store.add(new_job)
         return jsonify({"status": "added", "id": new_job['id']})
     if request.method == 'DELETE':
-        jid = int(request.args.get('id')); current = [x for x in current if x['id'] != jid]; save_json(SCHEDULE_FILE, current)
+        schedule_store.delete(int(request.args.get('id')))
         return jsonify({"status": "deleted"})
 
+@app.route('/api/timers', methods=['GET', 'POST', 'DELETE'])
+def api_timers():
+    if request.method == 'GET':
+        now = time.time()
+        return jsonify([{**timer, "remaining": round(max(0.0, timer['at'] - now), 3)} for timer in timer_queue.list()])
+    if request.method == 'POST':
+        # {"device", "action", "delay": seconds} for a countdown, or "at": epoch seconds or ISO time
+        data = request.json or {}
+        if not data.get('device') or data.get('action') not in SCHEDULE_OPS:
+            return jsonify({"status": "error", "error": "device and action (Turn ON, Turn OFF or Toggle) required"}), 400
+        try:
+            at = data.get('at')
+            if at is None: at = time.time() + float(data['delay'])
+            else: at = float(at) if isinstance(at, (int, float)) else datetime.datetime.fromisoformat(at).timestamp()
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"status": "error", "error": "delay in seconds or at required"}), 400
+        if not time.time() - SCHEDULE_GRACE <= at < float('inf'):
+            return jsonify({"status": "error", "error": "timer is in the past"}), 400
+        timer = timer_queue.add(data['device'], data['action'], at)
+        return jsonify({"status": "added", "id": timer['id'], "at": at})
+    if request.method == 'DELETE':
+        if not timer_queue.cancel(request.args.get('id', type=int)): return jsonify({"status": "not found"}), 404
+        return jsonify({"status": "cancelled"})
+
 if __name__ == "__main__":
     settings = load_json(SETTINGS_FILE, {})
+    load_device_cache()
+    threading.Thread(target=device_store.run, daemon=True).start()
+    atexit.register(device_store.close)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    schedule_store.load()
+    timer_queue.load()
+    if SSDP_LISTEN: ssdp_listener.start()
+    threading.Thread(target=warm_start.run, daemon=True).start()
     threading.Thread(target=scanner_loop, daemon=True).start()
     threading.Thread(target=poller_loop, daemon=True).start()
-    threading.Thread(target=scheduler_loop, daemon=True).start()
+    threading.Thread(target=timer_scheduler.run, daemon=True).start()
+    atexit.register(timer_scheduler.save_high_water, force=True)
+    threading.Thread(target=job_dispatcher.run, daemon=True).start()
+    threading.Thread(target=timer_queue.run, daemon=True).start()
+    atexit.register(timer_queue.flush)
     print(f"   WEMO OPS SERVER - LISTENING ON PORT {PORT}")
-    serve(app, host=HOST, port=PORT, threads=6)
\ No newline at end of file
+    serve(app, host=HOST, port=PORT, threads=max(SERVE_THREADS, MAX_STREAMS + 4))
\ No newline at end of file